@@ -4,12 +4,15 @@ AI群聊功能API端点
 此API专注于AI特有的功能，如AI响应触发和AI角色差异化
 """
 
+import asyncio
+import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, validator
-from app.database.session import get_db
+from app.database.session import get_db, SessionLocal
 from app.models.ai_chat import AiGroupMember, AiMessage, AiChatGroup, AiModel
 from app.services.ai_group_chat_service import AiGroupChatService
 from app.services.ai_relevance_detector import MessageRelevanceDetector, SmartTriggerDetector
@@ -48,6 +51,99 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+def _get_validated_ai_member(request: TriggerAIResponseRequest, db: Session) -> AiGroupMember:
+    """校验被触发的AI成员存在、属于指定群组且角色字段完整，/ai/respond 与流式接口共用"""
+    # 获取AI成员信息
+    logger.info(f"Querying AI member with ID: {request.member_id}")
+    ai_member = db.get(AiGroupMember, request.member_id)
+
+    if not ai_member:
+        logger.error(f"AI member with ID {request.member_id} not found")
+        raise HTTPException(status_code=404, detail="AI成员不存在")
+
+    logger.info(f"Found AI member: {ai_member.id}, checking group membership")
+    
+    # 验证群组和成员的匹配
+    if ai_member.group_id != request.group_id:
+        logger.error(f"AI member {request.member_id} does not belong to group {request.group_id}")
+        raise HTTPException(status_code=400, detail="AI成员不属于指定群组")
+
+    logger.info("Validating AI member fields...")
+    
+    # 验证AI成员的必要字段是否存在 - 使用 is None instead of not for SQLAlchemy compatibility
+    logger.info("Checking for None values in required fields...")
+    if ai_member.ai_model is None:
+        logger.error(f"AI member {request.member_id} model configuration is None")
+        raise HTTPException(status_code=400, detail="AI成员模型配置为None")
+    if ai_member.ai_nickname is None:
+        logger.error(f"AI member {request.member_id} nickname is None")
+        raise HTTPException(status_code=400, detail="AI成员昵称为None")
+    if ai_member.personality is None:
+        logger.error(f"AI member {request.member_id} personality is None")
+        raise HTTPException(status_code=400, detail="AI成员人格特征为None")
+    if ai_member.initial_stance is None:
+        logger.error(f"AI member {request.member_id} initial stance is None")
+        raise HTTPException(status_code=400, detail="AI成员初始立场为None")
+
+    return ai_member
+
+
+def _detect_skip_reasons(bind, group_id: int, member_id: int, trigger_message: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    在工作线程中执行相关性检测，应当回应时返回 None，否则返回不回应的原因
+
+    Session 不能跨线程共用，这里在同一引擎上打开线程自己的会话；
+    检测器按实例缓存的成员和消息也只在本线程内使用，返回值为普通字典
+    """
+    with Session(bind=bind) as session:
+        trigger_detector = SmartTriggerDetector(session)
+        should_trigger_result = trigger_detector.should_trigger_ai(group_id, member_id, trigger_message)
+        logger.info(f"SmartTriggerDetector result: {should_trigger_result}")
+        if should_trigger_result:
+            return None
+
+        trigger_reasons = trigger_detector.get_trigger_reasons(group_id, member_id)
+        logger.info(f"Trigger reasons: {trigger_reasons}")
+        return trigger_reasons
+
+
+async def _get_skip_reasons(request: TriggerAIResponseRequest, db: Session) -> Optional[List[Dict[str, Any]]]:
+    """
+    判断AI是否应当回应，应当回应时返回 None，否则返回不回应的原因
+
+    强制触发或提供了触发消息时视为用户明确要求AI回应，跳过相关性检测
+    """
+    logger.info("Checking if AI should be triggered...")
+    should_skip_relevance_check = request.force_trigger or (request.trigger_message is not None and request.trigger_message.strip() != "")
+    if should_skip_relevance_check:
+        return None
+
+    logger.info("Not forcing trigger and no trigger message, using SmartTriggerDetector")
+    # 相关性检测包含同步数据库查询和文本匹配，放到线程中执行，避免阻塞事件循环
+    return await asyncio.to_thread(
+        _detect_skip_reasons,
+        db.get_bind(),
+        request.group_id,
+        request.member_id,
+        request.trigger_message
+    )
+
+
+def _save_ai_message(db: Session, group_id: int, member_id: int, content: str) -> AiMessage:
+    """保存AI回复到群聊消息"""
+    new_message = AiMessage(
+        group_id=group_id,
+        member_id=member_id,
+        content=content,
+        message_type='text'
+    )
+    db.add(new_message)
+    db.commit()
+    db.refresh(new_message)
+    logger.info(f"Saved message with ID: {new_message.id}")
+    return new_message
+
+
 @router.post("/ai/respond", response_model=ApiResponse)
 async def trigger_ai_response(
     request: TriggerAIResponseRequest,
@@ -59,83 +155,20 @@ async def trigger_ai_response(
     """
     try:
         logger.info(f"Trigger AI Response called with request: {request.dict()}")
-        
-        # 获取AI成员信息
-        logger.info(f"Querying AI member with ID: {request.member_id}")
-        ai_member = db.query(AiGroupMember).filter(
-            AiGroupMember.id == request.member_id
-        ).first()
-
-        if not ai_member:
-            logger.error(f"AI member with ID {request.member_id} not found")
-            raise HTTPException(status_code=404, detail="AI成员不存在")
+        _get_validated_ai_member(request, db)
 
-        logger.info(f"Found AI member: {ai_member.id}, checking group membership")
-        
-        # 验证群组和成员的匹配
-        if ai_member.group_id != request.group_id:
-            logger.error(f"AI member {request.member_id} does not belong to group {request.group_id}")
-            raise HTTPException(status_code=400, detail="AI成员不属于指定群组")
-
-        logger.info("Validating AI member fields...")
-        
-        # 验证AI成员的必要字段是否存在 - 使用 is None instead of not for SQLAlchemy compatibility
-        logger.info("Checking for None values in required fields...")
-        if ai_member.ai_model is None:
-            logger.error(f"AI member {request.member_id} model configuration is None")
-            raise HTTPException(status_code=400, detail="AI成员模型配置为None")
-        if ai_member.ai_nickname is None:
-            logger.error(f"AI member {request.member_id} nickname is None")
-            raise HTTPException(status_code=400, detail="AI成员昵称为None")
-        if ai_member.personality is None:
-            logger.error(f"AI member {request.member_id} personality is None")
-            raise HTTPException(status_code=400, detail="AI成员人格特征为None")
-        if ai_member.initial_stance is None:
-            logger.error(f"AI member {request.member_id} initial stance is None")
-            raise HTTPException(status_code=400, detail="AI成员初始立场为None")
-
-        logger.info("Checking if AI should be triggered...")
-        
         # 检查是否应该触发AI（除非强制触发或提供了触发消息）
-        # 如果提供了触发消息，视为用户明确要求AI回应，应跳过相关性检测
-        should_skip_relevance_check = request.force_trigger or (request.trigger_message is not None and request.trigger_message.strip() != "")
-        if not should_skip_relevance_check:
-            logger.info("Not forcing trigger and no trigger message, using SmartTriggerDetector")
-            trigger_detector = SmartTriggerDetector(db)
-            should_trigger_result = trigger_detector.should_trigger_ai(
-                request.group_id,
-                request.member_id,
-                request.trigger_message
+        trigger_reasons = await _get_skip_reasons(request, db)
+        if trigger_reasons is not None:
+            return ApiResponse(
+                success=False,
+                message="AI认为当前不需要回应",
+                data={"reasons": trigger_reasons}
             )
-            logger.info(f"SmartTriggerDetector result: {should_trigger_result}")
-
-            if not should_trigger_result:
-                trigger_reasons = trigger_detector.get_trigger_reasons(
-                    request.group_id,
-                    request.member_id
-                )
-                logger.info(f"Trigger reasons: {trigger_reasons}")
-                return ApiResponse(
-                    success=False,
-                    message="AI认为当前不需要回应",
-                    data={"reasons": trigger_reasons}
-                )
-
-        # 创建AI群聊服务实例
-        logger.info("Creating AiGroupChatService instance")
-        ai_service = AiGroupChatService(db)
-
-        # 验证AI成员是否有效
-        logger.info("Validating AI member with service")
-        is_valid = ai_service.validate_ai_member(request.member_id, request.group_id)
-        logger.info(f"AI member validation result: {is_valid}")
-        
-        if not is_valid:
-            logger.error(f"AI member {request.member_id} validation failed")
-            raise HTTPException(status_code=404, detail="AI成员不存在或不属于该群组")
 
         # 生成AI响应
         logger.info("Generating AI response...")
+        ai_service = AiGroupChatService(db)
         response = await ai_service.generate_response(
             member_id=request.member_id,
             group_id=request.group_id,
@@ -145,16 +178,7 @@ async def trigger_ai_response(
 
         # 保存响应到数据库
         logger.info("Saving response to database...")
-        new_message = AiMessage(
-            group_id=request.group_id,
-            member_id=request.member_id,
-            content=response,
-            message_type='text'
-        )
-        db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
-        logger.info(f"Saved message with ID: {new_message.id}")
+        new_message = _save_ai_message(db, request.group_id, request.member_id, response)
 
         return ApiResponse(
             success=True,
@@ -174,6 +198,65 @@ async def trigger_ai_response(
         raise HTTPException(status_code=500, detail=f"AI响应生成失败: {str(e)}")
 
 
+def _sse_event(payload: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/ai/respond/stream")
+async def trigger_ai_response_stream(
+    request: TriggerAIResponseRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    流式触发AI成员响应
+    校验与触发判断同 /ai/respond；模型输出的内容以SSE事件逐段推送，
+    结束后做后处理和角色漂移检查，保存最终回复并推送消息ID与最终内容
+    """
+    # 校验、触发判断和提示词构建都在返回响应前完成，此时请求的数据库会话仍然可用
+    _get_validated_ai_member(request, db)
+    trigger_reasons = await _get_skip_reasons(request, db)
+    if trigger_reasons is not None:
+        async def skipped_stream() -> AsyncIterator[str]:
+            yield _sse_event({"skipped": True, "message": "AI认为当前不需要回应", "reasons": trigger_reasons})
+        return StreamingResponse(skipped_stream(), media_type="text/event-stream")
+
+    ai_service = AiGroupChatService(db)
+    try:
+        ai_member, full_prompt = await ai_service.build_response_prompt(
+            member_id=request.member_id,
+            group_id=request.group_id,
+            trigger_message=request.trigger_message
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def event_stream() -> AsyncIterator[str]:
+        chunks: List[str] = []
+        try:
+            async for delta in ai_service.generate_response_stream(ai_member, full_prompt):
+                chunks.append(delta)
+                yield _sse_event({"delta": delta})
+
+            # 依赖注入的会话在流式响应体开始发送前就已关闭（FastAPI 0.106 起 yield 依赖先于响应体退出），
+            # 结束阶段的漂移检查和保存使用流内自己的会话
+            with SessionLocal() as stream_db:
+                content = await AiGroupChatService(stream_db).finalize_response(
+                    ai_member, "".join(chunks), full_prompt
+                )
+                new_message = _save_ai_message(stream_db, request.group_id, request.member_id, content)
+                yield _sse_event({
+                    "done": True,
+                    "message_id": new_message.id,
+                    "content": content,
+                    "created_at": new_message.created_at
+                })
+        except Exception as e:
+            logger.error(f"Unexpected error in trigger_ai_response_stream: {str(e)}", exc_info=True)
+            yield _sse_event({"error": f"AI响应生成失败: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/group/{group_id}", response_model=ApiResponse)
 async def get_group_detail(
     group_id: int,
@@ -184,7 +267,7 @@ async def get_group_detail(
     包括成员信息（特别是AI成员的人格和立场）和消息
     """
     try:
-        group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+        group = db.get(AiChatGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
         
@@ -211,9 +294,7 @@ async def get_group_detail(
         
         message_list = []
         for msg in reversed(messages):  # 按时间顺序排列
-            sender = db.query(AiGroupMember).filter(
-                AiGroupMember.id == msg.member_id
-            ).first()
+            sender = db.get(AiGroupMember, msg.member_id)
             
             message_data = {
                 "id": msg.id,
@@ -250,7 +331,7 @@ async def get_group_messages(
     """获取群组消息"""
     try:
         # 验证群组是否存在
-        group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+        group = db.get(AiChatGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
         
@@ -260,9 +341,7 @@ async def get_group_messages(
         
         result_messages = []
         for msg in reversed(messages):  # 按时间顺序排列
-            sender = db.query(AiGroupMember).filter(
-                AiGroupMember.id == msg.member_id
-            ).first()
+            sender = db.get(AiGroupMember, msg.member_id)
             
             message_data = {
                 "id": msg.id,
@@ -301,9 +380,7 @@ async def get_ai_characteristics(
     用于前端显示AI的人格和立场信息
     """
     try:
-        ai_member = db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
+        ai_member = db.get(AiGroupMember, member_id)
         
         if not ai_member:
             raise HTTPException(status_code=404, detail="AI成员不存在")
@@ -372,7 +449,7 @@ async def send_message(
         logger.info(f"Send message to group {group_id}: {request.content}")
 
         # 1. 验证群组存在
-        group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+        group = db.get(AiChatGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
 
@@ -496,7 +573,7 @@ async def send_message_without_ai(
     """
     try:
         # 验证群组存在
-        group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+        group = db.get(AiChatGroup, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="群组不存在")
 
@@ -1,19 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Optional, List
 from app.database.session import get_db
 from app.schemas.conversation import (
     ConversationCreate, ConversationUpdate, ConversationResponse,
     ConversationMemberCreate, ConversationMemberUpdate, ConversationMemberResponse,
     ChatMessageCreate, ChatMessageUpdate, ChatMessageResponse,
-    PaginatedConversations, PaginatedMembers, PaginatedMessages, ConversationMemberWithUserInfo
+    PaginatedConversations, PaginatedMembers, PaginatedMessages, ConversationMemberWithUserInfo,
+    PaginatedConversationSummaries
 )
 from app.services.conversation import (
     get_conversation, get_conversations, create_conversation, update_conversation, delete_conversation,
-    get_conversation_member, get_conversation_members, add_conversation_member,
+    get_conversation_member, get_conversation_members, add_conversation_member, add_conversation_members,
     update_conversation_member, remove_conversation_member, get_user_conversations,
-    get_chat_messages, create_chat_message, update_chat_message, delete_chat_message,
-    get_user_messages, remove_user_from_conversation
+    get_chat_messages, create_chat_message, create_chat_messages, update_chat_message, delete_chat_message,
+    get_user_messages, remove_user_from_conversation, encode_message_cursor, decode_message_cursor
 )
 from app.core.config import settings
 
@@ -50,8 +51,7 @@ def update_conversation_endpoint(
 @router.delete("/{conversation_id}")
 def delete_conversation_endpoint(conversation_id: str, db: Session = Depends(get_db)):
     """删除会话"""
-    db_conversation = delete_conversation(db=db, conversation_id=conversation_id)
-    if db_conversation is None:
+    if not delete_conversation(db=db, conversation_id=conversation_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     return {"message": "会话删除成功"}
 
@@ -61,13 +61,16 @@ def read_conversations(
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
     conversation_type: Optional[str] = Query(None, description="会话类型筛选"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
     db: Session = Depends(get_db)
 ):
     """获取会话列表（支持分页和类型筛选）"""
-    conversations, total = get_conversations(db=db, skip=skip, limit=limit, conversation_type=conversation_type)
+    conversations, total = get_conversations(
+        db=db, skip=skip, limit=limit, conversation_type=conversation_type, include_total=include_total
+    )
     
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
     
     return PaginatedConversations(
         total=total,
@@ -85,6 +88,13 @@ def add_member_to_conversation(member: ConversationMemberCreate, db: Session = D
     return add_conversation_member(db=db, member=member)
 
 
+@router.post("/members/batch")
+def add_members_batch(members: List[ConversationMemberCreate], db: Session = Depends(get_db)):
+    """批量添加会话成员（一次写入，适用于创建群聊时拉入多人）"""
+    added = add_conversation_members(db=db, members=members)
+    return {"message": "会话成员批量添加成功", "added": added}
+
+
 @router.get("/members/{member_id}", response_model=ConversationMemberResponse)
 def read_conversation_member(member_id: int, db: Session = Depends(get_db)):
     """根据ID获取会话成员"""
@@ -108,8 +118,7 @@ def update_conversation_member_endpoint(
 @router.delete("/members/{member_id}")
 def remove_conversation_member_endpoint(member_id: int, db: Session = Depends(get_db)):
     """移除会话成员"""
-    db_member = remove_conversation_member(db=db, member_id=member_id)
-    if db_member is None:
+    if not remove_conversation_member(db=db, member_id=member_id):
         raise HTTPException(status_code=404, detail="会话成员不存在")
     return {"message": "会话成员移除成功"}
 
@@ -119,43 +128,16 @@ def read_conversation_members(
     conversation_id: str,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
     db: Session = Depends(get_db)
 ):
     """获取会话成员列表（支持分页）"""
-    from app.models.conversation import ConversationMember
-    from app.models.historical_figure import HistoricalFigure
-    from app.schemas.conversation import ConversationMemberWithUserInfo
-
-    # 使用JOIN查询获取成员的名称和头像信息
-    query = db.query(
-        ConversationMember,
-        HistoricalFigure.name.label('member_name'),
-        HistoricalFigure.avatar.label('avatar')
-    ).outerjoin(
-        HistoricalFigure, ConversationMember.user_id == HistoricalFigure.id
-    ).filter(ConversationMember.conversation_id == conversation_id)
-
-    total_query = db.query(ConversationMember).filter(ConversationMember.conversation_id == conversation_id)
-    total = total_query.count()
-
-    results = query.offset(skip).limit(limit).all()
-
-    # 将结果转换为包含额外字段的对象
-    members = []
-    for member, member_name, avatar in results:
-        member_response = ConversationMemberWithUserInfo(
-            conversation_id=member.conversation_id,
-            user_id=member.user_id,
-            user_role=member.user_role,
-            id=member.id,
-            joined_at=member.joined_at,
-            member_name=member_name,
-            avatar=avatar
-        )
-        members.append(member_response)
+    members, total = get_conversation_members(
+        db=db, conversation_id=conversation_id, skip=skip, limit=limit, include_total=include_total
+    )
 
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
 
     return PaginatedMembers(
         total=total,
@@ -166,20 +148,23 @@ def read_conversation_members(
     )
 
 
-@router.get("/user/{user_id}/conversations", response_model=PaginatedConversations)
+@router.get("/user/{user_id}/conversations", response_model=PaginatedConversationSummaries)
 def read_user_conversations(
     user_id: int,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
     db: Session = Depends(get_db)
 ):
-    """获取用户参与的所有会话"""
-    conversations, total = get_user_conversations(db=db, user_id=user_id, skip=skip, limit=limit)
+    """获取用户参与的所有会话（附带最后一条消息与成员数）"""
+    conversations, total = get_user_conversations(
+        db=db, user_id=user_id, skip=skip, limit=limit, include_total=include_total
+    )
     
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
     
-    return PaginatedConversations(
+    return PaginatedConversationSummaries(
         total=total,
         page=(skip // limit) + 1,
         size=limit,
@@ -191,19 +176,37 @@ def read_user_conversations(
 @router.delete("/{conversation_id}/members/user/{user_id}")
 def remove_user_from_conversation_endpoint(conversation_id: str, user_id: int, db: Session = Depends(get_db)):
     """将用户从会话中移除"""
-    db_member = remove_user_from_conversation(db=db, conversation_id=conversation_id, user_id=user_id)
-    if db_member is None:
+    if not remove_user_from_conversation(db=db, conversation_id=conversation_id, user_id=user_id):
         raise HTTPException(status_code=404, detail="用户不在该会话中")
     return {"message": "用户已从会话中移除"}
 
 
 # 消息相关API
+def _parse_cursor(cursor: Optional[str], skip: int):
+    """解析请求中的分页游标，游标与 skip 偏移分页不能同时使用"""
+    if cursor is None:
+        return None
+    if skip:
+        raise HTTPException(status_code=400, detail="cursor 与 skip 不能同时使用")
+    try:
+        return decode_message_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/messages/", response_model=ChatMessageResponse)
 def create_message(message: ChatMessageCreate, db: Session = Depends(get_db)):
     """创建新消息"""
     return create_chat_message(db=db, message=message)
 
 
+@router.post("/messages/batch")
+def create_messages_batch(messages: List[ChatMessageCreate], db: Session = Depends(get_db)):
+    """批量创建消息（一次写入，适用于导入整段对话）"""
+    created = create_chat_messages(db=db, messages=messages)
+    return {"message": "消息批量创建成功", "created": created}
+
+
 @router.get("/messages/{message_id}", response_model=ChatMessageResponse)
 def read_message(message_id: int, db: Session = Depends(get_db)):
     """根据ID获取消息"""
@@ -227,8 +230,7 @@ def update_message_endpoint(
 @router.delete("/messages/{message_id}")
 def delete_message_endpoint(message_id: int, db: Session = Depends(get_db)):
     """删除消息（软删除）"""
-    db_message = delete_chat_message(db=db, message_id=message_id)
-    if db_message is None:
+    if not delete_chat_message(db=db, message_id=message_id):
         raise HTTPException(status_code=404, detail="消息不存在")
     return {"message": "消息已删除"}
 
@@ -238,31 +240,41 @@ def read_messages(
     conversation_id: str,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的next_cursor），不能与skip同时使用，传入时不统计总数"),
     db: Session = Depends(get_db)
 ):
-    """获取会话中的消息列表（支持分页）"""
-    messages, total = get_chat_messages(db=db, conversation_id=conversation_id, skip=skip, limit=limit)
+    """
+    获取会话中的消息列表（支持分页）
+
+    - 偏移分页：传 skip/limit，返回 page/pages（include_total 为 True 时含 total）
+    - 游标分页：传上一页返回的 next_cursor 作为 cursor，不能同时传 skip（否则返回400），
+      响应中 total/page/pages 为 null，继续翻页使用 next_cursor
+    """
+    messages, total = get_chat_messages(
+        db=db, conversation_id=conversation_id, skip=skip, limit=limit,
+        include_total=include_total and cursor is None, cursor=_parse_cursor(cursor, skip)
+    )
 
     # 处理头像URL - 如果不是以http开头，则拼接域名
     processed_messages = []
     for message in messages:
-        message_dict = message.__dict__.copy()  # 创建副本以避免修改原始对象
-        if hasattr(message, 'avatar') and message.avatar:
-            avatar = message.avatar
-            # 如果头像URL不是以http开头，则拼接域名
-            if not avatar.lower().startswith(('http://', 'https://')):
-                message_dict['avatar'] = f"{settings.SERVER_DOMAIN}/{avatar.lstrip('/')}"
+        message_dict = dict(message)  # 行映射只读，复制为字典再修改
+        avatar = message_dict.get('avatar')
+        if avatar and not avatar.lower().startswith(('http://', 'https://')):
+            message_dict['avatar'] = f"{settings.SERVER_DOMAIN}/{avatar.lstrip('/')}"
         processed_messages.append(ChatMessageResponse(**message_dict))
 
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
 
     return PaginatedMessages(
         total=total,
-        page=(skip // limit) + 1,
+        page=(skip // limit) + 1 if cursor is None else None,
         size=limit,
         pages=pages,
-        data=processed_messages
+        data=processed_messages,
+        next_cursor=encode_message_cursor(processed_messages[-1]) if len(messages) == limit else None
     )
 
 
@@ -271,18 +283,32 @@ def read_user_messages(
     user_id: int,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的next_cursor），不能与skip同时使用，传入时不统计总数"),
     db: Session = Depends(get_db)
 ):
-    """获取用户发送的所有消息"""
-    messages, total = get_user_messages(db=db, user_id=user_id, skip=skip, limit=limit)
+    """
+    获取用户发送的所有消息（按时间倒序）
+
+    - 偏移分页：传 skip/limit，返回 page/pages（include_total 为 True 时含 total）
+    - 游标分页：传上一页返回的 next_cursor 作为 cursor，不能同时传 skip（否则返回400），
+      响应中 total/page/pages 为 null，继续翻页使用 next_cursor
+    """
+    messages, total = get_user_messages(
+        db=db, user_id=user_id, skip=skip, limit=limit,
+        include_total=include_total and cursor is None, cursor=_parse_cursor(cursor, skip)
+    )
     
+    messages = [ChatMessageResponse(**message) for message in messages]
+
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
     
     return PaginatedMessages(
         total=total,
-        page=(skip // limit) + 1,
+        page=(skip // limit) + 1 if cursor is None else None,
         size=limit,
         pages=pages,
-        data=messages
+        data=messages,
+        next_cursor=encode_message_cursor(messages[-1]) if len(messages) == limit else None
     )
\ No newline at end of file
@@ -59,10 +59,11 @@ def delete_figure(figure_id: int, db: Session = Depends(get_db)):
 def read_figures(
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, ge=1, le=100, description="每页显示的记录数"),
+    include_total: bool = Query(True, description="是否统计总数，无限滚动加载时可关闭以跳过COUNT查询"),
     db: Session = Depends(get_db)
 ):
     """获取历史人物列表（支持分页）"""
-    figures, total = get_historical_figures(db=db, skip=skip, limit=limit)
+    figures, total = get_historical_figures(db=db, skip=skip, limit=limit, include_total=include_total)
 
     # 处理头像URL - 如果不是以http开头，则拼接域名
     processed_figures = []
@@ -76,7 +77,7 @@ def read_figures(
         processed_figures.append(HistoricalFigureResponse(**figure_dict))
 
     # 计算总页数
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
 
     return PaginatedHistoricalFigures(
         total=total,
@@ -76,37 +76,7 @@ def read_conversation_members(conversation_id: str, db: Session):
     """
     获取会话成员列表的辅助函数
     """
-    from app.models.conversation import ConversationMember
-    from app.models.historical_figure import HistoricalFigure
-    from app.schemas.conversation import ConversationMemberWithUserInfo
-
-    # 使用JOIN查询获取成员的名称和头像信息
-    query = db.query(
-        ConversationMember,
-        HistoricalFigure.name.label('member_name'),
-        HistoricalFigure.avatar.label('avatar')
-    ).outerjoin(
-        HistoricalFigure, ConversationMember.user_id == HistoricalFigure.id
-    ).filter(ConversationMember.conversation_id == conversation_id)
-
-    total_query = db.query(ConversationMember).filter(ConversationMember.conversation_id == conversation_id)
-    total = total_query.count()
-
-    results = query.limit(100).all()  # 限制返回数量
-
-    # 将结果转换为包含额外字段的对象
-    members = []
-    for member, member_name, avatar in results:
-        member_response = ConversationMemberWithUserInfo(
-            conversation_id=member.conversation_id,
-            user_id=member.user_id,
-            user_role=member.user_role,
-            id=member.id,
-            joined_at=member.joined_at,
-            member_name=member_name,
-            avatar=avatar
-        )
-        members.append(member_response)
+    members, total = get_conversation_members(db=db, conversation_id=conversation_id, skip=0, limit=100)  # 限制返回数量
 
     return PaginatedMembers(
         total=total,
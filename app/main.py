@@ -4,6 +4,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+from contextlib import asynccontextmanager
 import logging
 
 # 配置日志
@@ -20,16 +21,24 @@ from app.api import ai_group_chat
 from app.api import auth
 from app.api import image_compression
 from app.database.session import engine, Base
+from app.services.ai_model_service import AiModelService
 from app.core.config import settings as app_settings
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：关闭时释放AI模型服务共享的HTTP连接池"""
+    yield
+    await AiModelService.close_session()
+
 # 创建FastAPI应用
 app = FastAPI(
     title="自媒体营销系统API",
     description="自媒体营销系统的后端API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
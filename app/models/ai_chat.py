@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Enum, BigInteger
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Enum, BigInteger, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy import and_
@@ -30,6 +30,19 @@ class AiGroupMember(Base):
     user_id = Column(Integer, nullable=True, comment='当member_type=1的时候 ，从ai_models中取值；')
     member_type = Column(Integer, nullable=True, comment='0 人  1 AI')
 
+    # 通过模型名称关联AI模型配置（无外键，只读）
+    ai_model_obj = relationship(
+        'AiModel',
+        primaryjoin='foreign(AiGroupMember.ai_model) == AiModel.model_name',
+        uselist=False,
+        viewonly=True
+    )
+
+    __table_args__ = (
+        # 上下文构建时频繁按群组过滤成员
+        Index('ix_ai_group_member_group', 'group_id'),
+    )
+
 
 class AiMessage(Base):
     __tablename__ = "ai_messages"
@@ -40,7 +53,11 @@ class AiMessage(Base):
     content = Column(Text, nullable=False, comment='消息内容')
     message_type = Column(Enum('text', 'image', 'file', name='message_type_enum'), default='text', comment='消息类型')
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
-    
+
+    __table_args__ = (
+        # 覆盖 WHERE group_id = ? ORDER BY created_at LIMIT N，避免filesort
+        Index('ix_ai_message_group_created', 'group_id', 'created_at'),
+    )
 
 
 class AiModel(Base):
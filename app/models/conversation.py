@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, BigInteger, Integer, Text, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, String, BigInteger, Integer, Text, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.dialects.mysql import ENUM, JSON
 from sqlalchemy.sql import func
 from app.database.session import Base
@@ -18,6 +18,11 @@ class Conversation(Base):
     created_at = Column(DateTime, server_default=func.current_timestamp(), comment='创建时间')
     updated_at = Column(DateTime, server_default=func.current_timestamp(), onupdate=func.current_timestamp(), comment='更新时间')
 
+    __table_args__ = (
+        # 会话列表按 updated_at 倒序分页
+        Index('ix_conversation_updated', 'updated_at'),
+    )
+
 
 class ConversationMember(Base):
     """
@@ -32,6 +37,7 @@ class ConversationMember(Base):
     joined_at = Column(DateTime, server_default=func.current_timestamp(), comment='加入时间')
 
     __table_args__ = (
+        # 唯一约束同时覆盖 (conversation_id, user_id) 及 conversation_id 前缀查询
         UniqueConstraint('conversation_id', 'user_id', name='uk_conversation_user'),
     )
 
@@ -52,4 +58,11 @@ class ChatMessage(Base):
     message_metadata = Column('metadata', JSON, comment='扩展元数据，如图片尺寸、文件大小等')
     created_at = Column(DateTime, server_default=func.current_timestamp(), comment='创建时间')
     updated_at = Column(DateTime, server_default=func.current_timestamp(), onupdate=func.current_timestamp(), comment='更新时间')
-    display_time = Column(String(8), comment='消息显示时间')  # 使用String存储TIME类型
\ No newline at end of file
+    display_time = Column(String(8), comment='消息显示时间')  # 使用String存储TIME类型
+
+    __table_args__ = (
+        # 覆盖 WHERE conversation_id = ? AND is_deleted = 0 ORDER BY created_at, id
+        Index('ix_chat_message_conv_deleted_created', 'conversation_id', 'is_deleted', 'created_at'),
+        # 覆盖 WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index('ix_chat_message_user_created', 'user_id', 'created_at'),
+    )
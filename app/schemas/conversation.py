@@ -1,6 +1,33 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, Dict, Any, List
-from datetime import datetime
+from datetime import datetime, time
+
+
+def _normalize_display_time(value):
+    """规范请求中的显示时间：如"昨天 16:14"只保留时间部分并补齐为 HH:MM:SS"""
+    if not value:
+        return value
+    if isinstance(value, (datetime, time)):
+        # datetime/time 与字符串一样只保留时间部分
+        return value.strftime('%H:%M:%S')
+    if not isinstance(value, str):
+        raise ValueError('display_time 必须是时间字符串或 datetime/time 类型')
+    if ':' in value:
+        # 提取时间部分 (HH:MM 或 HH:MM:SS)
+        time_part = value.split()[-1]  # 取最后一个部分，通常是时间
+        if len(time_part.split(':')) == 2:  # 如果是 HH:MM 格式
+            time_part += ':00'  # 添加秒部分
+        return time_part
+    return value
+
+
+def _format_display_time(value):
+    """数据库 TIME 列读出的 timedelta 转为 HH:MM:SS 字符串，其他值原样返回"""
+    if value is None or not hasattr(value, 'total_seconds'):
+        return value
+    minutes, seconds = divmod(int(value.total_seconds()), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
 
 class ConversationBase(BaseModel):
@@ -33,6 +60,14 @@ class ConversationResponse(ConversationBase):
     model_config = {"from_attributes": True}
 
 
+class ConversationSummary(ConversationResponse):
+    """会话列表项：附带最后一条消息与成员数，供聊天列表直接渲染"""
+    last_message_id: Optional[int] = None
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    member_count: int = 0
+
+
 class ConversationMemberBase(BaseModel):
     conversation_id: str
     user_id: int
@@ -88,6 +123,11 @@ class ChatMessageCreate(BaseModel):
     message_metadata: Optional[Dict[str, Any]] = None
     display_time: Optional[str] = None
 
+    @field_validator('display_time', mode='before')
+    @classmethod
+    def normalize_display_time(cls, v):
+        return _normalize_display_time(v)
+
 
 class ChatMessageUpdate(BaseModel):
     content: Optional[str] = None
@@ -97,6 +137,11 @@ class ChatMessageUpdate(BaseModel):
     message_metadata: Optional[Dict[str, Any]] = None
     display_time: Optional[str] = None
 
+    @field_validator('display_time', mode='before')
+    @classmethod
+    def normalize_display_time(cls, v):
+        return _normalize_display_time(v)
+
 
 class ChatMessageResponse(ChatMessageBase):
     id: int
@@ -107,26 +152,41 @@ class ChatMessageResponse(ChatMessageBase):
 
     model_config = {"from_attributes": True}
 
+    @field_validator('display_time', mode='before')
+    @classmethod
+    def format_display_time(cls, v):
+        # 数据库 TIME 列读出的是 timedelta，序列化时转为字符串
+        return _format_display_time(v)
+
 
 class PaginatedConversations(BaseModel):
-    total: int
+    total: Optional[int] = None  # 请求时关闭统计总数则为 None
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
     data: List[ConversationResponse]
 
 
-class PaginatedMessages(BaseModel):
-    total: int
+class PaginatedConversationSummaries(BaseModel):
+    total: Optional[int] = None  # 请求时关闭统计总数则为 None
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
+    data: List[ConversationSummary]
+
+
+class PaginatedMessages(BaseModel):
+    total: Optional[int] = None  # 请求时关闭统计总数则为 None
+    page: Optional[int] = None  # 游标分页时为 None
+    size: int
+    pages: Optional[int] = None
     data: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None  # 下一页游标，没有更多数据时为 None
 
 
 class PaginatedMembers(BaseModel):
-    total: int
+    total: Optional[int] = None  # 请求时关闭统计总数则为 None
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
     data: List[ConversationMemberWithUserInfo]
\ No newline at end of file
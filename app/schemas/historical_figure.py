@@ -29,8 +29,8 @@ class HistoricalFigureResponse(HistoricalFigureBase):
 
 
 class PaginatedHistoricalFigures(BaseModel):
-    total: int
+    total: Optional[int] = None  # 请求时关闭统计总数则为 None
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
     data: List[HistoricalFigureResponse]
\ No newline at end of file
@@ -16,9 +16,7 @@ class AiCharacterService:
 
     def get_character_prompt(self, member_id: int) -> str:
         """根据成员ID获取角色提示（使用现有字段）"""
-        member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
+        member = self.db.get(AiGroupMember, member_id)
 
         if not member:
             raise ValueError(f"AI成员不存在: {member_id}")
@@ -54,18 +52,19 @@ class RoleConsistencyMiddleware:
 
     def validate_response(self, member_id: int, response: str) -> tuple[bool, str]:
         """验证响应是否符合AI角色（基于现有字段）"""
-        member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
+        member = self.db.get(AiGroupMember, member_id)
 
         if not member:
             raise ValueError(f"AI成员不存在: {member_id}")
 
+        # 响应只转换一次小写，供各项检查共用
+        response_lower = response.lower()
+
         # 检查响应是否体现了AI的个性
-        reflects_personality = member.personality is not None and member.personality.lower() in response.lower()
+        reflects_personality = member.personality is not None and member.personality.lower() in response_lower
 
         # 检查是否维持了初始立场
-        maintains_stance = member.initial_stance is not None and member.initial_stance.lower() in response.lower()
+        maintains_stance = member.initial_stance is not None and member.initial_stance.lower() in response_lower
 
         consistency_score = sum([reflects_personality, maintains_stance])
 
@@ -89,8 +88,8 @@ class CharacterDriftPrevention:
         self.db = db_session
         self.response_history = {}  # 缓存AI响应历史
 
-    def detect_drift(self, member_id: int, new_response: str) -> bool:
-        """检测AI是否发生角色漂移（简化版）"""
+    def detect_drift(self, member_id: int, new_response: str, member: Optional[AiGroupMember] = None) -> bool:
+        """检测AI是否发生角色漂移（简化版），member 已加载时传入可省去一次查询"""
         # 获取AI的历史响应
         historical_responses = self._get_historical_responses(member_id)
 
@@ -100,7 +99,7 @@ class CharacterDriftPrevention:
 
         # 检查新响应是否符合历史模式和人格特征
         consistency_metrics = self._calculate_consistency(
-            member_id, historical_responses, new_response
+            member_id, historical_responses, new_response, member=member
         )
 
         # 如果一致性低于阈值，则认为发生漂移
@@ -124,11 +123,16 @@ class CharacterDriftPrevention:
 
         return responses
 
-    def _calculate_consistency(self, member_id: int, historical_responses: List[str], new_response: str):
+    def _calculate_consistency(
+        self,
+        member_id: int,
+        historical_responses: List[str],
+        new_response: str,
+        member: Optional[AiGroupMember] = None
+    ):
         """计算新响应与历史响应及人格特征的一致性"""
-        member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
+        if member is None:
+            member = self.db.get(AiGroupMember, member_id)
 
         if not member:
             raise ValueError(f"AI成员不存在: {member_id}")
@@ -180,28 +184,32 @@ class ConsistencyReinforcement:
     def __init__(self, db_session: Session):
         self.db = db_session
 
-    def reinforce_character(self, member_id: int, context_messages: list) -> str:
-        """强化AI角色特征（简化版）"""
-        member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
+    def reinforce_character(
+        self,
+        member_id: int,
+        context_messages: list,
+        member: Optional[AiGroupMember] = None
+    ) -> str:
+        """强化AI角色特征（简化版），member 已加载时传入可省去一次查询"""
+        if member is None:
+            member = self.db.get(AiGroupMember, member_id)
 
         # 获取AI最近的几次响应
         recent_responses = self._get_recent_responses(member_id, 2)
 
-        # 构建强化提示
-        reinforcement_prompt = f"""
+        # 构建强化提示（收集片段后一次性拼接）
+        prompt_parts = [f"""
         你是{member.ai_nickname}。
         你的性格特点是：{member.personality}。
         你的立场是：{member.initial_stance}。
-        """
+        """]
 
         if recent_responses:
-            reinforcement_prompt += f"你之前说过：{'; '.join(recent_responses)}"
+            prompt_parts.append(f"你之前说过：{'; '.join(recent_responses)}")
 
-        reinforcement_prompt += "请继续以这种方式回应，保持你的独特个性和观点。"
+        prompt_parts.append("请继续以这种方式回应，保持你的独特个性和观点。")
 
-        return reinforcement_prompt
+        return "".join(prompt_parts)
 
     def _get_recent_responses(self, member_id: int, count: int):
         """获取AI最近的响应"""
@@ -8,6 +8,8 @@ from app.schemas.ai_chat import (
     AiMessageCreate, AiMessageUpdate,
     AiModelCreate, AiModelUpdate
 )
+from app.services.mention_parser import invalidate_group_roster
+from app.services.ai_group_chat_service import invalidate_group_prompts
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,7 +17,7 @@ logger = logging.getLogger(__name__)
 # AI Chat Group Services
 def get_ai_chat_group(db: Session, group_id: int):
     """根据ID获取群聊"""
-    return db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+    return db.get(AiChatGroup, group_id)
 
 
 def get_ai_chat_groups(db: Session, skip: int = 0, limit: int = 10, status: Optional[str] = None, user_id: Optional[int] = None):
@@ -69,7 +71,7 @@ def create_ai_chat_group(db: Session, group: AiChatGroupCreate):
 
 def update_ai_chat_group(db: Session, group_id: int, group_update: AiChatGroupUpdate):
     """更新群聊信息"""
-    db_group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+    db_group = db.get(AiChatGroup, group_id)
     if db_group:
         update_data = group_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -81,17 +83,19 @@ def update_ai_chat_group(db: Session, group_id: int, group_update: AiChatGroupUp
 
 def delete_ai_chat_group(db: Session, group_id: int):
     """删除群聊"""
-    db_group = db.query(AiChatGroup).filter(AiChatGroup.id == group_id).first()
+    db_group = db.get(AiChatGroup, group_id)
     if db_group:
         db.delete(db_group)
         db.commit()
+        invalidate_group_roster(group_id)
+        invalidate_group_prompts(group_id)
     return db_group
 
 
 # AI Group Member Services
 def get_ai_group_member(db: Session, member_id: int):
     """根据ID获取群成员"""
-    return db.query(AiGroupMember).filter(AiGroupMember.id == member_id).first()
+    return db.get(AiGroupMember, member_id)
 
 
 def get_ai_group_members(db: Session, group_id: int, skip: int = 0, limit: int = 10, member_type: Optional[int] = None):
@@ -140,34 +144,45 @@ def create_ai_group_member(db: Session, member: AiGroupMemberCreate):
     db.add(db_member)
     db.commit()
     db.refresh(db_member)
+    invalidate_group_roster(db_member.group_id)
+    invalidate_group_prompts(db_member.group_id)
     return db_member
 
 
 def update_ai_group_member(db: Session, member_id: int, member_update: AiGroupMemberUpdate):
     """更新群成员信息"""
-    db_member = db.query(AiGroupMember).filter(AiGroupMember.id == member_id).first()
+    db_member = db.get(AiGroupMember, member_id)
     if db_member:
+        previous_group_id = db_member.group_id
         update_data = member_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_member, field, value)
         db.commit()
         db.refresh(db_member)
+        # 昵称、成员类型或所属群组可能变化，新旧群组的@名册和提示词（历史消息中的身份与昵称）都需失效
+        invalidate_group_roster(previous_group_id)
+        invalidate_group_roster(db_member.group_id)
+        invalidate_group_prompts(previous_group_id)
+        invalidate_group_prompts(db_member.group_id)
     return db_member
 
 
 def delete_ai_group_member(db: Session, member_id: int):
     """删除群成员"""
-    db_member = db.query(AiGroupMember).filter(AiGroupMember.id == member_id).first()
+    db_member = db.get(AiGroupMember, member_id)
     if db_member:
+        group_id = db_member.group_id
         db.delete(db_member)
         db.commit()
+        invalidate_group_roster(group_id)
+        invalidate_group_prompts(group_id)
     return db_member
 
 
 # AI Message Services
 def get_ai_message(db: Session, message_id: int):
     """根据ID获取消息"""
-    return db.query(AiMessage).filter(AiMessage.id == message_id).first()
+    return db.get(AiMessage, message_id)
 
 
 def get_ai_messages(db: Session, group_id: int, skip: int = 0, limit: int = 10):
@@ -189,29 +204,35 @@ def create_ai_message(db: Session, message: AiMessageCreate):
 
 def update_ai_message(db: Session, message_id: int, message_update: AiMessageUpdate):
     """更新消息信息"""
-    db_message = db.query(AiMessage).filter(AiMessage.id == message_id).first()
+    db_message = db.get(AiMessage, message_id)
     if db_message:
+        previous_group_id = db_message.group_id
         update_data = message_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_message, field, value)
         db.commit()
         db.refresh(db_message)
+        # 修改的可能不是最新消息，最新消息ID不变，需主动清除提示词缓存
+        invalidate_group_prompts(previous_group_id)
+        invalidate_group_prompts(db_message.group_id)
     return db_message
 
 
 def delete_ai_message(db: Session, message_id: int):
     """删除消息"""
-    db_message = db.query(AiMessage).filter(AiMessage.id == message_id).first()
+    db_message = db.get(AiMessage, message_id)
     if db_message:
+        group_id = db_message.group_id
         db.delete(db_message)
         db.commit()
+        invalidate_group_prompts(group_id)
     return db_message
 
 
 # AI Model Services
 def get_ai_model(db: Session, model_id: int):
     """根据ID获取AI模型"""
-    model = db.query(AiModel).filter(AiModel.id == model_id).first()
+    model = db.get(AiModel, model_id)
     if model:
         # Convert is_active integer back to boolean for response
         model.is_active = bool(model.is_active)
@@ -252,7 +273,7 @@ def create_ai_model(db: Session, model: AiModelCreate):
 
 def update_ai_model(db: Session, model_id: int, model_update: AiModelUpdate):
     """更新AI模型信息"""
-    db_model = db.query(AiModel).filter(AiModel.id == model_id).first()
+    db_model = db.get(AiModel, model_id)
     if db_model:
         update_data = model_update.model_dump(exclude_unset=True)
 
@@ -269,7 +290,7 @@ def update_ai_model(db: Session, model_id: int, model_update: AiModelUpdate):
 
 def delete_ai_model(db: Session, model_id: int):
     """删除AI模型"""
-    db_model = db.query(AiModel).filter(AiModel.id == model_id).first()
+    db_model = db.get(AiModel, model_id)
     if db_model:
         db.delete(db_model)
         db.commit()
@@ -5,7 +5,8 @@ AI群聊上下文管理系统
 
 from __future__ import annotations
 from typing import Optional, List
-from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, aliased
 from app.models.ai_chat import AiGroupMember, AiMessage
 
 
@@ -17,11 +18,16 @@ class ConversationContextManager:
         """构建完整的对话上下文"""
         # 获取最近的对话历史
         messages = self.db.query(AiMessage).filter(
-            AiMessage.group_id == group_id
+            AiMessage.group_id == group_id,
+            AiMessage.content.isnot(None)
         ).order_by(
             AiMessage.created_at.asc()  # 按时间升序排列
         ).limit(limit).all()
 
+        return "\n".join(self._format_conversation_lines(group_id, messages))
+
+    def _format_conversation_lines(self, group_id: int, messages: List[AiMessage]) -> List[str]:
+        """将消息格式化为“昵称（AI/人类）: 内容”的行列表"""
         # 获取群组成员信息以确定类型
         group_members = self.db.query(AiGroupMember).filter(
             AiGroupMember.group_id == group_id
@@ -33,13 +39,11 @@ class ConversationContextManager:
         # 构建格式化的对话历史
         conversation_history = []
         for msg in messages:
-            # 检查消息内容是否为None
-            if msg.content is None:
-                continue  # 跳过内容为None的消息
+            # NULL 已在 SQL 中排除，这里只跳过空白内容
+            if not msg.content.strip():
+                continue
 
-            sender = self.db.query(AiGroupMember).filter(
-                AiGroupMember.id == msg.member_id
-            ).first()
+            sender = self.db.get(AiGroupMember, msg.member_id)
 
             sender_name = sender.ai_nickname if (sender and sender.ai_nickname is not None) else "Unknown"
             
@@ -47,17 +51,22 @@ class ConversationContextManager:
             sender_type = "（AI）" if sender and member_types.get(msg.member_id) == 1 else "（人类）"
             conversation_history.append(f"{sender_name}{sender_type}: {msg.content}")
 
-        return "\n".join(conversation_history)
+        return conversation_history
 
     def extract_topic_and_context(self, group_id: int) -> tuple[str, str]:
         """提取当前讨论的主题和上下文"""
-        # 获取最近的对话
-        recent_messages = self.build_conversation_context(group_id, limit=20)
+        # 只取最近5条消息，假设其中包含了当前讨论的主要话题
+        recent_messages = self.db.query(AiMessage).filter(
+            AiMessage.group_id == group_id,
+            AiMessage.content.isnot(None)
+        ).order_by(
+            AiMessage.created_at.desc()
+        ).limit(5).all()
 
         # 简单的主题提取（实际应用中可以使用NLP技术）
-        lines = recent_messages.split('\n')
-        # 假设最近几行包含了当前讨论的主要话题
-        topic_context = '\n'.join(lines[-5:]) if len(lines) >= 5 else recent_messages
+        topic_context = "\n".join(
+            self._format_conversation_lines(group_id, list(reversed(recent_messages)))
+        )
 
         # 这里可以加入更复杂的主题识别逻辑
         return self._identify_topic(topic_context), topic_context
@@ -77,16 +86,11 @@ class SelectiveContextProvider:
     def provide_context(self, group_id: int, target_member_id: int) -> str:
         """为特定AI提供定制化上下文"""
         # 获取目标AI的信息
-        target_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == target_member_id
-        ).first()
+        target_member = self.db.get(AiGroupMember, target_member_id)
 
         if not target_member:
             raise ValueError(f"AI成员不存在: {target_member_id}")
 
-        # 获取完整的对话历史
-        full_conversation = self.conversation_manager.build_conversation_context(group_id)
-
         # 获取当前讨论的主题
         current_topic, topic_context = self.conversation_manager.extract_topic_and_context(group_id)
 
@@ -105,9 +109,7 @@ class SelectiveContextProvider:
         if relevant_messages:
             context_parts.append("\n与你相关的消息：")
             for msg in relevant_messages:
-                sender = self.db.query(AiGroupMember).filter(
-                    AiGroupMember.id == msg.member_id
-                ).first()
+                sender = self.db.get(AiGroupMember, msg.member_id)
                 sender_name = sender.ai_nickname if (sender and sender.ai_nickname is not None) else "Unknown"
                 context_parts.append(f"{sender_name}: {msg.content}")
 
@@ -116,40 +118,46 @@ class SelectiveContextProvider:
         if recent_messages:
             context_parts.append("\n最新对话：")
             for msg in recent_messages:
-                sender = self.db.query(AiGroupMember).filter(
-                    AiGroupMember.id == msg.member_id
-                ).first()
+                sender = self.db.get(AiGroupMember, msg.member_id)
                 sender_name = sender.ai_nickname if (sender and sender.ai_nickname is not None) else "Unknown"
                 context_parts.append(f"{sender_name}: {msg.content}")
 
         return "\n".join(context_parts)
 
     def _identify_relevant_messages(self, group_id: int, target_member: AiGroupMember, limit: int):
-        """识别与目标AI相关的消息"""
-        all_messages = self.db.query(AiMessage).filter(
-            AiMessage.group_id == group_id
+        """识别与目标AI相关的消息（提及目标AI或由目标AI发送）"""
+        # 昵称为空时无法判断提及关系
+        if target_member.ai_nickname is None:
+            return []
+
+        # 在SQL中完成过滤，@昵称 同样包含昵称本身，autoescape 转义 LIKE 通配符
+        relevant_messages = self.db.query(AiMessage).filter(
+            AiMessage.group_id == group_id,
+            AiMessage.content.isnot(None),
+            or_(
+                AiMessage.member_id == target_member.id,
+                AiMessage.content.contains(target_member.ai_nickname, autoescape=True)
+            )
         ).order_by(
             AiMessage.created_at.desc()
-        ).limit(limit * 2).all()
-
-        relevant_messages = []
-        for msg in reversed(all_messages):
-            # 检查是否提及目标AI - 需要确保字段不是None
-            if (target_member.ai_nickname is not None and 
-                ((msg.content is not None and f"@{target_member.ai_nickname}" in msg.content) or
-                 (msg.content is not None and target_member.ai_nickname in msg.content) or
-                 msg.member_id == target_member.id)):
-                relevant_messages.append(msg)
+        ).limit(limit).all()
 
-        return relevant_messages[-limit:] if len(relevant_messages) > limit else relevant_messages
+        return list(reversed(relevant_messages))
 
     def _get_recent_messages(self, group_id: int, limit: int):
-        """获取最新的消息"""
-        return self.db.query(AiMessage).filter(
-            AiMessage.group_id == group_id
+        """获取最新的消息（按时间升序返回）"""
+        # 子查询取最新的N条，外层在数据库中按时间升序重新排序
+        latest = self.db.query(AiMessage).filter(
+            AiMessage.group_id == group_id,
+            AiMessage.content.isnot(None)
         ).order_by(
             AiMessage.created_at.desc()
-        ).limit(limit).all()[::-1]  # 反转以获得正确的时间顺序
+        ).limit(limit).subquery()
+        recent_message = aliased(AiMessage, latest)
+
+        return self.db.query(recent_message).order_by(
+            recent_message.created_at.asc()
+        ).all()
 
 
 def build_context_aware_prompt(
@@ -223,11 +231,10 @@ def build_enhanced_context(
     """
     构建增强的对话上下文，区分Self/Other AI/Human（基于现有字段）
     """
-    from app.models.ai_chat import AiMessage, AiGroupMember
-    
     # 获取最近的对话历史
     messages = db_session.query(AiMessage).filter(
-        AiMessage.group_id == group_id
+        AiMessage.group_id == group_id,
+        AiMessage.content.isnot(None)
     ).order_by(
         AiMessage.created_at.asc()
     ).limit(message_limit).all()
@@ -294,6 +301,25 @@ def format_messages(messages):
     return "\n".join(formatted_lines)
 
 
+# 时间线身份标签
+IDENTITY_SELF = "[自己]"
+IDENTITY_OTHER_AI = "[其他AI]"
+IDENTITY_HUMAN = "[人类]"
+IDENTITY_UNKNOWN = "[未知]"
+
+_IDENTITY_BY_MEMBER_TYPE = {1: IDENTITY_OTHER_AI, 0: IDENTITY_HUMAN}
+
+
+def _build_identity_labels(member_types: dict, target_member_id: int) -> dict:
+    """按成员预先计算身份标签 {member_id: 标签}，循环中只需一次字典查找"""
+    identity_by_member = {
+        member_id: _IDENTITY_BY_MEMBER_TYPE.get(member_type, IDENTITY_UNKNOWN)
+        for member_id, member_type in member_types.items()
+    }
+    identity_by_member[target_member_id] = IDENTITY_SELF
+    return identity_by_member
+
+
 def format_timeline_messages(
     messages: List[AiMessage],
     member_types: dict,
@@ -315,37 +341,24 @@ def format_timeline_messages(
     if not messages:
         return "暂无对话历史"
 
-    from app.models.ai_chat import AiGroupMember
-
     # 批量查询发送者信息
     member_ids = list(set([msg.member_id for msg in messages if msg.member_id]))
     members = db_session.query(AiGroupMember).filter(
         AiGroupMember.id.in_(member_ids)
     ).all()
-    member_map = {m.id: m for m in members}
-
-    formatted_lines = []
-    for msg in messages:
-        if not msg.content:
-            continue
-
-        sender_type = member_types.get(msg.member_id, -1)
-        member = member_map.get(msg.member_id)
-        nickname = member.ai_nickname if member and member.ai_nickname else "未知"
-
-        # 确定身份标签
-        if msg.member_id == target_member_id:
-            identity = "[自己]"
-        elif sender_type == 1:
-            identity = "[其他AI]"
-        elif sender_type == 0:
-            identity = "[人类]"
-        else:
-            identity = "[未知]"
-
-        formatted_lines.append(f"{identity} {nickname}: {msg.content}")
-
-    return "\n".join(formatted_lines)
+    nickname_by_member = {m.id: m.ai_nickname or "未知" for m in members}
+    identity_by_member = _build_identity_labels(member_types, target_member_id)
+
+    # 一次性拼接，不产生中间列表
+    # 注意：不要用 numba @njit 加速这里，numba 对字符串/f-string 支持有限，字符串处理反而比 CPython 慢
+    nickname_get = nickname_by_member.get
+    identity_get = identity_by_member.get
+    # NULL 已在 SQL 中排除，空白内容不输出空行
+    return "\n".join(
+        f"{identity_get(msg.member_id, IDENTITY_UNKNOWN)} {nickname_get(msg.member_id, '未知')}: {msg.content}"
+        for msg in messages
+        if msg.content.strip()
+    )
 
 
 def build_timeline_context(
@@ -366,11 +379,10 @@ def build_timeline_context(
             "participants": [参与者列表]
         }
     """
-    from app.models.ai_chat import AiMessage, AiGroupMember
-
     # 获取最近的对话历史（按时间升序）
     messages = db_session.query(AiMessage).filter(
-        AiMessage.group_id == group_id
+        AiMessage.group_id == group_id,
+        AiMessage.content.isnot(None)
     ).order_by(
         AiMessage.created_at.asc()
     ).limit(message_limit).all()
@@ -403,21 +415,26 @@ def build_timeline_context(
         AiGroupMember.id.in_(member_ids)
     ).all()
     member_map = {m.id: m for m in members}
+    identity_by_member = _build_identity_labels(member_types, target_member_id)
 
+    member_get = member_map.get
+    identity_get = identity_by_member.get
+    add_participant = participant_names.add
     for msg in reversed(messages):  # 从后往前找最新消息
-        if not msg.content:
+        if not msg.content.strip():
             continue
 
-        sender_type = member_types.get(msg.member_id, -1)
-        member = member_map.get(msg.member_id)
+        member_id = msg.member_id
+        identity = identity_get(member_id, IDENTITY_UNKNOWN)
+        member = member_get(member_id)
         if member and member.ai_nickname:
-            participant_names.add(member.ai_nickname)
+            add_participant(member.ai_nickname)
 
-        if msg.member_id == target_member_id:
+        if identity == IDENTITY_SELF:
             self_message_count += 1
-        elif sender_type == 0 and last_human_message is None:  # 人类
+        elif identity == IDENTITY_HUMAN and last_human_message is None:  # 人类
             last_human_message = msg.content
-        elif sender_type == 1 and last_other_ai_message is None:  # 其他AI
+        elif identity == IDENTITY_OTHER_AI and last_other_ai_message is None:  # 其他AI
             last_other_ai_message = msg.content
 
         if last_human_message and last_other_ai_message:
@@ -444,8 +461,6 @@ def create_role_aware_prompt(
         return _create_timeline_prompt(ai_member, context)
 
     # 兼容旧的分类格式
-    from app.services.ai_context_manager import format_messages
-
     return f"""
 你是{ai_member.ai_nickname}，一个人格化AI助手。
 
@@ -5,8 +5,12 @@ AI群聊主服务
 
 from __future__ import annotations
 import asyncio
-from typing import Optional
-from sqlalchemy.orm import Session
+import re
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 from app.models.ai_chat import AiGroupMember, AiMessage, AiModel, AiChatGroup
 from app.services.ai_model_service import AiModelService
 from app.services.ai_character_service import AiCharacterService, CharacterDriftPrevention, ConsistencyReinforcement
@@ -21,6 +25,26 @@ from app.services.ai_context_manager import (
 )
 from app.services.ai_relevance_detector import SmartTriggerDetector
 
+# 提示词缓存：(group_id, member_id, 最新消息ID, 角色设定) -> 基础提示词
+# 同一人类消息触发多个AI或重复触发时，若群内无新消息则直接复用
+_PROMPT_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_PROMPT_CACHE_MAX_SIZE = 256
+_PROMPT_CACHE_LOCK = threading.Lock()
+
+
+def invalidate_group_prompts(group_id: int) -> None:
+    """群内消息被修改/删除或成员变动后清除该群的提示词缓存（最新消息ID不会因此变化）"""
+    with _PROMPT_CACHE_LOCK:
+        stale_keys = [cache_key for cache_key in _PROMPT_CACHE if cache_key[0] == group_id]
+        for cache_key in stale_keys:
+            del _PROMPT_CACHE[cache_key]
+
+# 响应后处理用到的正则，模块加载时编译一次
+# 多余的**与#：两者互不影响，合并为一次扫描（列表符号和换行依赖前一步结果，需单独处理）
+_RE_MARKUP = re.compile(r'\*{2,}|#+')
+_RE_BULLETS = re.compile(r'^\s*[-*]\s*', re.MULTILINE)  # 列表符号
+_RE_NEWLINES = re.compile(r'\n{3,}')  # 重复的换行符
+
 
 class AiGroupChatService:
     def __init__(self, db_session: Session):
@@ -39,12 +63,106 @@ class AiGroupChatService:
         trigger_message: Optional[str] = None
     ) -> str:
         """生成AI响应"""
-        
-        # 1. 验证AI成员存在
-        ai_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
-        
+        # 1~4. 校验成员与模型并构建提示词
+        ai_member, full_prompt = await self.build_response_prompt(
+            member_id, group_id, trigger_message
+        )
+
+        # 5. 调用AI模型生成响应
+        try:
+            response = await self.ai_model_service.generate_with_model(
+                ai_model=ai_member.ai_model_obj,
+                prompt=full_prompt,
+                max_tokens=300,  # 控制回复长度
+                temperature=0.8  # 增加一些随机性使回复更自然
+            )
+        except Exception as e:
+            raise RuntimeError(f"AI模型调用失败: {str(e)}")
+
+        # 6~7. 后处理并检查角色漂移
+        return await self.finalize_response(ai_member, response, full_prompt)
+
+    async def finalize_response(
+        self,
+        ai_member: AiGroupMember,
+        response: str,
+        full_prompt: str
+    ) -> str:
+        """对模型的完整输出做后处理和角色漂移检查，返回最终保存的回复（流式与非流式共用）"""
+        # 后处理：去除过度格式化内容，使回复更自然
+        processed_response = self._post_process_response(response)
+
+        # 检查角色漂移
+        if self.drift_prevention.detect_drift(ai_member.id, processed_response, member=ai_member):
+            # 如果检测到漂移，尝试修正
+            processed_response = await self._correct_response_if_drifting(
+                ai_member, processed_response, full_prompt
+            )
+
+        return processed_response
+
+    async def build_response_prompt(
+        self,
+        member_id: int,
+        group_id: int,
+        trigger_message: Optional[str] = None
+    ) -> tuple[AiGroupMember, str]:
+        """校验成员与模型并构建完整提示词"""
+        # 整段同步数据库工作放到线程中执行，避免阻塞事件循环（线程内使用独立会话）
+        ai_member, base_prompt = await asyncio.to_thread(
+            self._prepare_prompt, member_id, group_id
+        )
+
+        # 如果有触发消息，将其添加到提示中（片段收集后一次性拼接）
+        prompt_parts = [base_prompt]
+        if trigger_message is not None and trigger_message.strip():
+            prompt_parts.append(f"\n\n【特别提醒】\n有人特别提到你并询问：\"{trigger_message}\"\n请优先回应这个问题。")
+        return ai_member, "".join(prompt_parts)
+
+    async def generate_response_stream(
+        self,
+        ai_member: AiGroupMember,
+        full_prompt: str
+    ) -> AsyncIterator[str]:
+        """流式生成AI响应，逐段返回模型原始输出
+
+        流式输出无法在发送前整体检查角色漂移，调用方应在结束后对完整文本调用 finalize_response。
+        """
+        try:
+            async for delta in self.ai_model_service.generate_stream(
+                ai_model=ai_member.ai_model_obj,
+                prompt=full_prompt,
+                max_tokens=300,
+                temperature=0.8
+            ):
+                yield delta
+        except Exception as e:
+            raise RuntimeError(f"AI模型调用失败: {str(e)}")
+
+    def _prepare_prompt(self, member_id: int, group_id: int) -> tuple[AiGroupMember, str]:
+        """
+        验证AI成员及模型配置，并构建基础提示词（在工作线程中执行）
+
+        Session 不能跨线程共用，这里在同一引擎上打开线程自己的会话，用完即关闭；
+        返回的成员对象已加载所需字段和模型配置，脱离会话后仍可在事件循环中读取。
+        """
+        with Session(bind=self.db.get_bind()) as db:
+            return self._prepare_prompt_with_session(db, member_id, group_id)
+
+    def _prepare_prompt_with_session(
+        self,
+        db: Session,
+        member_id: int,
+        group_id: int
+    ) -> tuple[AiGroupMember, str]:
+        """使用给定会话验证AI成员及模型配置，并构建基础提示词"""
+        # 1. 验证AI成员存在（同一次查询中联表加载AI模型配置）
+        ai_member = db.get(
+            AiGroupMember,
+            member_id,
+            options=[joinedload(AiGroupMember.ai_model_obj)]
+        )
+
         if not ai_member:
             raise ValueError(f"AI成员不存在: {member_id}")
 
@@ -52,9 +170,7 @@ class AiGroupChatService:
         if ai_member.ai_model is None or not ai_member.ai_model.strip():
             raise ValueError(f"AI成员缺少模型配置: {member_id}")
 
-        ai_model = self.db.query(AiModel).filter(
-            AiModel.model_name == ai_member.ai_model
-        ).first()
+        ai_model = ai_member.ai_model_obj
 
         if not ai_model or (hasattr(ai_model, 'is_active') and ai_model.is_active is False):
             raise ValueError(f"AI模型不可用: {ai_member.ai_model}")
@@ -65,65 +181,67 @@ class AiGroupChatService:
         if not ai_model.api_key or not ai_model.api_key.strip():
             raise ValueError(f"AI模型API密钥配置缺失: {ai_member.ai_model}")
 
-        # 3. 获取时间线格式的上下文（按时间顺序，明确标注身份）
+        # 3~4. 构建角色感知提示词（时间线格式，带缓存）
+        full_prompt = self._get_base_prompt(db, ai_member, group_id)
+
+        return ai_member, full_prompt
+
+    def _get_base_prompt(self, db: Session, ai_member: AiGroupMember, group_id: int) -> str:
+        """获取基础提示词，群内无新消息时命中缓存，跳过上下文构建"""
+        latest_message_id = db.query(func.max(AiMessage.id)).filter(
+            AiMessage.group_id == group_id
+        ).scalar()
+
+        # 角色设定纳入缓存键，成员资料修改后自动失效
+        cache_key = (
+            group_id,
+            ai_member.id,
+            latest_message_id,
+            ai_member.ai_nickname,
+            ai_member.personality,
+            ai_member.initial_stance
+        )
+        with _PROMPT_CACHE_LOCK:
+            cached_prompt = _PROMPT_CACHE.get(cache_key)
+            if cached_prompt is not None:
+                _PROMPT_CACHE.move_to_end(cache_key)
+                return cached_prompt
+
+        # 获取时间线格式的上下文（按时间顺序，明确标注身份）
         timeline_context = build_timeline_context(
-            db_session=self.db,
-            target_member_id=member_id,
+            db_session=db,
+            target_member_id=ai_member.id,
             group_id=group_id,
             message_limit=20
         )
 
-        # 4. 构建角色感知提示词（使用时间线格式）
-        full_prompt = create_role_aware_prompt(
+        # 构建角色感知提示词（使用时间线格式）
+        prompt = create_role_aware_prompt(
             ai_member=ai_member,
             context=timeline_context
         )
 
-        # 如果有触发消息，将其添加到提示中
-        if trigger_message is not None and trigger_message.strip():
-            full_prompt += f"\n\n【特别提醒】\n有人特别提到你并询问：\"{trigger_message}\"\n请优先回应这个问题。"
-
-        # 5. 调用AI模型生成响应
-        try:
-            response = await self.ai_model_service.generate(
-                model_name=ai_member.ai_model,
-                prompt=full_prompt,
-                max_tokens=300,  # 控制回复长度
-                temperature=0.8  # 增加一些随机性使回复更自然
-            )
-        except Exception as e:
-            raise RuntimeError(f"AI模型调用失败: {str(e)}")
-
-        # 6. 后处理：去除过度格式化内容，使回复更自然
-        processed_response = self._post_process_response(response)
+        with _PROMPT_CACHE_LOCK:
+            _PROMPT_CACHE[cache_key] = prompt
+            if len(_PROMPT_CACHE) > _PROMPT_CACHE_MAX_SIZE:
+                _PROMPT_CACHE.popitem(last=False)
 
-        # 7. 检查角色漂移
-        if self.drift_prevention.detect_drift(member_id, processed_response):
-            # 如果检测到漂移，尝试修正
-            processed_response = await self._correct_response_if_drifting(
-                member_id, processed_response, full_prompt
-            )
-
-        return processed_response
+        return prompt
 
     async def _correct_response_if_drifting(
         self,
-        member_id: int,
+        ai_member: AiGroupMember,
         original_response: str,
         original_prompt: str
     ) -> str:
-        """如果检测到角色漂移，修正响应"""
+        """如果检测到角色漂移，修正响应（复用已加载的成员对象，不再重复查询）"""
         
         # 获取AI的强化提示
         reinforcement_prompt = ConsistencyReinforcement(self.db).reinforce_character(
-            member_id, []
+            ai_member.id, [], member=ai_member
         )
 
         # 重新生成响应，加强角色特征
-        ai_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id
-        ).first()
-
         correction_prompt = f"""
 {reinforcement_prompt}
 
@@ -137,8 +255,8 @@ class AiGroupChatService:
 """
 
         try:
-            corrected_response = await self.ai_model_service.generate(
-                model_name=ai_member.ai_model,
+            corrected_response = await self.ai_model_service.generate_with_model(
+                ai_model=ai_member.ai_model_obj,
                 prompt=correction_prompt,
                 max_tokens=300,
                 temperature=0.6  # 稍微降低随机性以提高一致性
@@ -150,27 +268,14 @@ class AiGroupChatService:
 
         return corrected_response
 
-    def validate_ai_member(self, member_id: int, group_id: int) -> bool:
-        """验证AI成员的有效性"""
-        ai_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == member_id,
-            AiGroupMember.group_id == group_id
-        ).first()
-        
-        return ai_member is not None
-
     def _post_process_response(self, response: str) -> str:
         """后处理AI响应，使其更自然"""
-        # 去除过度的格式化标记
-        import re
-        
         # 移除过多的星号、井号等格式符号
-        processed = re.sub(r'\*{2,}', '', response)  # 移除多余的**
-        processed = re.sub(r'#{1,}', '', processed)   # 移除多余的#
-        processed = re.sub(r'^\s*[-*]\s*', '', processed, flags=re.MULTILINE)  # 移除列表符号
+        processed = _RE_MARKUP.sub('', response)
+        processed = _RE_BULLETS.sub('', processed)
         
         # 限制重复的换行符
-        processed = re.sub(r'\n{3,}', '\n\n', processed)
+        processed = _RE_NEWLINES.sub('\n\n', processed)
         
         # 修剪首尾空白
         processed = processed.strip()
@@ -183,8 +288,6 @@ class AiGroupChatService:
 
     def validate_group_exists(self, group_id: int) -> bool:
         """验证群组是否存在"""
-        group = self.db.query(AiChatGroup).filter(
-            AiChatGroup.id == group_id
-        ).first()
+        group = self.db.get(AiChatGroup, group_id)
         
         return group is not None
\ No newline at end of file
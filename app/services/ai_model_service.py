@@ -4,8 +4,10 @@ AI模型服务
 """
 
 from __future__ import annotations
+import asyncio
 import json
-from typing import Dict, Any
+import ssl
+from typing import Dict, Any, Optional, AsyncIterator
 from sqlalchemy.orm import Session
 from app.models.ai_chat import AiModel
 import logging
@@ -24,11 +26,60 @@ except ImportError:
     aiohttp = None
     print("警告: aiohttp模块未安装，AI模型服务将无法正常工作。请运行: pip install aiohttp")
 
+# 优先使用orjson序列化/解析请求与响应体，未安装时回退到标准库json
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
 
 class AiModelService:
+    # 全应用共享的HTTP会话，复用连接池（keep-alive），避免每次调用重新握手TCP/TLS
+    _session: Optional["aiohttp.ClientSession"] = None
+    _session_lock = asyncio.Lock()
+
     def __init__(self, db_session: Session):
         self.db = db_session
 
+    @classmethod
+    async def _get_session(cls) -> "aiohttp.ClientSession":
+        """获取共享的HTTP会话，首次使用时创建"""
+        if aiohttp is None:
+            raise ImportError("aiohttp模块未安装，请运行: pip install aiohttp")
+
+        if cls._session is None or cls._session.closed:
+            async with cls._session_lock:
+                if cls._session is None or cls._session.closed:
+                    import certifi
+
+                    # 创建SSL上下文，使用certifi提供的证书（只加载一次）
+                    ssl_context = ssl.create_default_context(cafile=certifi.where())
+                    connector = aiohttp.TCPConnector(
+                        ssl=ssl_context,
+                        limit=100,
+                        ttl_dns_cache=300,
+                        keepalive_timeout=60
+                    )
+                    cls._session = aiohttp.ClientSession(
+                        connector=connector,
+                        json_serialize=_json_dumps
+                    )
+
+        return cls._session
+
+    @classmethod
+    async def close_session(cls) -> None:
+        """关闭共享的HTTP会话（应用关闭时调用）"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
     async def generate(self, model_name: str, prompt: str, max_tokens: int = 500, temperature: float = 0.7) -> str:
         """调用AI模型生成响应"""
         # 获取模型配置
@@ -39,7 +90,18 @@ class AiModelService:
         if not ai_model or (hasattr(ai_model, 'is_active') and ai_model.is_active is False):
             raise ValueError(f"AI模型不可用: {model_name}")
 
+        return await self.generate_with_model(ai_model, prompt, max_tokens, temperature)
+
+    async def generate_with_model(
+        self,
+        ai_model: AiModel,
+        prompt: str,
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ) -> str:
+        """使用调用方已加载并校验过的模型配置生成响应，省去一次数据库查询"""
         # 根据模型类型调用相应API
+        model_name = ai_model.model_name
         if "openai" in model_name.lower():
             return await self._call_openai_api(ai_model, prompt, max_tokens, temperature)
         elif "qwen" in model_name.lower() or "ali" in model_name.lower():
@@ -48,17 +110,31 @@ class AiModelService:
             # 默认使用OpenAI兼容接口
             return await self._call_openai_api(ai_model, prompt, max_tokens, temperature)
 
-    async def _call_openai_api(self, ai_model: AiModel, prompt: str, max_tokens: int, temperature: float) -> str:
-        """调用OpenAI API"""
-        if aiohttp is None:
-            raise ImportError("aiohttp模块未安装，请运行: pip install aiohttp")
-
-        import ssl
-        import certifi
-        
-        # 创建SSL上下文，使用certifi提供的证书
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        
+    async def generate_stream(
+        self,
+        ai_model: AiModel,
+        prompt: str,
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ) -> AsyncIterator[str]:
+        """流式生成响应，模型每输出一段内容即返回一段，缩短首字延迟"""
+        model_name = ai_model.model_name.lower()
+        if "openai" not in model_name and ("qwen" in model_name or "ali" in model_name):
+            # 阿里云接口暂未接入流式输出，整段返回
+            yield await self._call_alibaba_api(ai_model, prompt, max_tokens, temperature)
+            return
+
+        async for delta in self._stream_openai_api(ai_model, prompt, max_tokens, temperature):
+            yield delta
+
+    def _build_openai_request(
+        self,
+        ai_model: AiModel,
+        prompt: str,
+        max_tokens: int,
+        temperature: float
+    ) -> tuple[Dict[str, str], Dict[str, Any]]:
+        """构建OpenAI兼容接口的请求头和请求体"""
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {ai_model.api_key}"
@@ -70,33 +146,65 @@ class AiModelService:
             "max_tokens": max_tokens,
             "temperature": temperature
         }
+        return headers, payload
+
+    async def _stream_openai_api(
+        self,
+        ai_model: AiModel,
+        prompt: str,
+        max_tokens: int,
+        temperature: float
+    ) -> AsyncIterator[str]:
+        """以SSE方式调用OpenAI兼容接口，逐段返回增量内容"""
+        headers, payload = self._build_openai_request(ai_model, prompt, max_tokens, temperature)
+        payload["stream"] = True
+
+        logging.info(f"流式调用OpenAI API，模型: {ai_model.model_name}")
+        session = await self._get_session()
+        async with session.post(
+            f"{ai_model.endpoint}/chat/completions",
+            headers=headers,
+            json=payload
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"API调用失败: {await response.text()}")
+
+            # 每行形如 "data: {json}"，以 "data: [DONE]" 结束
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                choices = _json_loads(data).get("choices") or []
+                if choices:
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def _call_openai_api(self, ai_model: AiModel, prompt: str, max_tokens: int, temperature: float) -> str:
+        """调用OpenAI API"""
+        headers, payload = self._build_openai_request(ai_model, prompt, max_tokens, temperature)
         logging.info(f"调用OpenAI API，模型: {ai_model.model_name}, 请求体: {payload}")
         logging.info(f"OpenAI API端点: {ai_model.endpoint}")
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(
-                f"{ai_model.endpoint}/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                result = await response.json()
+        session = await self._get_session()
+        async with session.post(
+            f"{ai_model.endpoint}/chat/completions",
+            headers=headers,
+            json=payload
+        ) as response:
+            result = await response.json(loads=_json_loads)
 
-                if response.status != 200:
-                    raise Exception(f"API调用失败: {result}")
+            if response.status != 200:
+                raise Exception(f"API调用失败: {result}")
 
-                return result["choices"][0]["message"]["content"].strip()
+            return result["choices"][0]["message"]["content"].strip()
 
     async def _call_alibaba_api(self, ai_model: AiModel, prompt: str, max_tokens: int, temperature: float) -> str:
         """调用阿里云API"""
-        if aiohttp is None:
-            raise ImportError("aiohttp模块未安装，请运行: pip install aiohttp")
-        
-        import ssl
-        import certifi
-        
-        # 创建SSL上下文，使用certifi提供的证书
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-
         # 这里需要根据阿里云实际API接口调整
         # 示例代码（需要根据实际API文档修改）
         headers = {
@@ -110,16 +218,15 @@ class AiModelService:
             "temperature": temperature
         }
 
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(
-                ai_model.endpoint,
-                headers=headers,
-                json=payload
-            ) as response:
-                result = await response.json()
+        session = await self._get_session()
+        async with session.post(
+            ai_model.endpoint,
+            headers=headers,
+            json=payload
+        ) as response:
+            result = await response.json(loads=_json_loads)
 
-                if response.status != 200:
-                    raise Exception(f"API调用失败: {result}")
+            if response.status != 200:
+                raise Exception(f"API调用失败: {result}")
 
-                return result["response"]["output"]["text"].strip()
\ No newline at end of file
+            return result["response"]["output"]["text"].strip()
\ No newline at end of file
@@ -4,23 +4,68 @@ AI相关性检测服务
 """
 
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, NamedTuple, Tuple
 from sqlalchemy.orm import Session
 from app.models.ai_chat import AiGroupMember, AiMessage
 
 
+# 角色触发规则：(性格关键词, 消息关键词)，性格包含前者时，消息包含后者视为与角色相关
+ROLE_TRIGGER_RULES = (
+    ("专家", "问题"),
+    ("批判", "辩论"),
+    ("指导", "建议"),
+)
+
+
+class MemberTokens(NamedTuple):
+    """AI成员立场/性格的预处理结果"""
+    stance_keywords: Tuple[str, ...]  # 小写后的立场关键词（保留顺序与重复）
+    personality_lower: str            # 小写后的性格描述，空白时为""
+    role_triggers: Tuple[str, ...]    # 该成员适用的消息触发关键词
+
+
+@lru_cache(maxsize=1024)
+def _tokenize_member(stance: Optional[str], personality: Optional[str]) -> MemberTokens:
+    """按字段内容缓存分词结果，成员资料修改后内容变化即自动使用新结果"""
+    stance_keywords = tuple(stance.lower().split()) if stance is not None and stance.strip() else ()
+    personality_lower = personality.lower() if personality is not None and personality.strip() else ""
+    role_triggers = tuple(
+        message_keyword for personality_keyword, message_keyword in ROLE_TRIGGER_RULES
+        if personality_keyword in personality_lower
+    )
+    return MemberTokens(stance_keywords, personality_lower, role_triggers)
+
+
 class MessageRelevanceDetector:
     def __init__(self, db_session: Session):
         self.db = db_session
 
-    def detect_relevance(self, message: AiMessage, target_member: AiGroupMember) -> Dict[str, Any]:
-        """检测消息与目标AI的相关性"""
+    def detect_relevance(
+        self,
+        message: AiMessage,
+        target_member: AiGroupMember,
+        previous_member_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        检测消息与目标AI的相关性
+
+        Args:
+            message: 待检测的消息
+            target_member: 目标AI成员
+            previous_member_id: 该消息前一条消息的发送者ID（由调用方批量查询后传入）
+        """
+        # 消息内容与成员分词结果只计算一次，供各项检查共用
+        content = message.content if message.content is not None else ""
+        content_lower = content.lower()
+        tokens = _tokenize_member(target_member.initial_stance, target_member.personality)
+
         relevance_scores = {
-            'direct_mention': self._check_direct_mention(message, target_member),
-            'indirect_reference': self._check_indirect_reference(message, target_member),
-            'topic_alignment': self._check_topic_alignment(message, target_member),
-            'role_relevance': self._check_role_relevance(message, target_member),
-            'stance_relevance': self._check_stance_relevance(message, target_member)
+            'direct_mention': self._check_direct_mention(content, target_member),
+            'indirect_reference': self._check_indirect_reference(content, target_member, previous_member_id),
+            'topic_alignment': self._check_topic_alignment(content_lower, tokens),
+            'role_relevance': self._check_role_relevance(content_lower, tokens),
+            'stance_relevance': self._check_stance_relevance(content_lower, tokens)
         }
 
         # 计算总体相关性分数
@@ -33,98 +78,106 @@ class MessageRelevanceDetector:
             'relevance_type': self._determine_relevance_type(relevance_scores)
         }
 
-    def _check_direct_mention(self, message: AiMessage, target_member: AiGroupMember) -> float:
+    def is_relevant(
+        self,
+        message: AiMessage,
+        target_member: AiGroupMember,
+        previous_member_id: Optional[int] = None
+    ) -> bool:
+        """
+        只判断消息是否与目标AI相关，结果与 detect_relevance(...)['is_relevant'] 一致
+
+        各项分数均非负，按 detect_relevance 的求和顺序累加，累计分数超过阈值即返回，
+        直接提及等高分情况无需再计算其余各项。
+        """
+        content = message.content if message.content is not None else ""
+
+        total_score = self._check_direct_mention(content, target_member)
+        if total_score > 0.5:
+            return True
+
+        total_score += self._check_indirect_reference(content, target_member, previous_member_id)
+        if total_score > 0.5:
+            return True
+
+        content_lower = content.lower()
+        tokens = _tokenize_member(target_member.initial_stance, target_member.personality)
+        for check in (self._check_topic_alignment, self._check_role_relevance, self._check_stance_relevance):
+            total_score += check(content_lower, tokens)
+            if total_score > 0.5:
+                return True
+
+        return False
+
+    def _check_direct_mention(self, content: str, target_member: AiGroupMember) -> float:
         """检查是否直接提及目标AI"""
         # 检查@提及 - 需要确保 ai_nickname 不为 None
-        if target_member.ai_nickname is not None and f"@{target_member.ai_nickname}" in message.content:
+        if target_member.ai_nickname is not None and f"@{target_member.ai_nickname}" in content:
             return 1.0  # 完全相关
 
         # 检查不带@的直接称呼 - 需要确保 ai_nickname 不为 None
-        if target_member.ai_nickname is not None and target_member.ai_nickname in message.content:
+        if target_member.ai_nickname is not None and target_member.ai_nickname in content:
             return 0.8  # 高度相关
 
         return 0.0  # 无关
 
-    def _check_indirect_reference(self, message: AiMessage, target_member: AiGroupMember) -> float:
+    def _check_indirect_reference(
+        self,
+        content: str,
+        target_member: AiGroupMember,
+        previous_member_id: Optional[int] = None
+    ) -> float:
         """检查间接引用或暗示"""
         # 检查是否提到目标AI的立场关键词
         if (target_member.initial_stance is not None and target_member.initial_stance.strip() and
-            message.content is not None and target_member.initial_stance in message.content):
+            target_member.initial_stance in content):
             return 0.6  # 中等相关
 
         # 检查是否提到目标AI的性格特征
         if (target_member.personality is not None and target_member.personality.strip() and
-            message.content is not None and target_member.personality in message.content):
+            target_member.personality in content):
             return 0.5  # 中等相关
 
         # 检查是否在回复目标AI的上一条消息
-        previous_message = self._get_previous_message(message)
-        if previous_message is not None and previous_message.member_id == target_member.id:
+        if previous_member_id is not None and previous_member_id == target_member.id:
             return 0.7  # 高相关（回复该AI的消息）
 
         return 0.0
 
-    def _check_topic_alignment(self, message: AiMessage, target_member: AiGroupMember) -> float:
+    def _check_topic_alignment(self, content_lower: str, tokens: MemberTokens) -> float:
         """检查话题是否与目标AI的专业领域或兴趣相关"""
         # 检查消息内容是否涉及目标AI的立场话题
-        if (target_member.initial_stance is not None and target_member.initial_stance.strip() and
-            message.content is not None and message.content.strip()):
-            stance_keywords = target_member.initial_stance.split()
-            message_words = message.content.lower().split()
+        stance_keywords = tokens.stance_keywords
+        if stance_keywords and content_lower.strip():
+            message_words = set(content_lower.split())
 
-            matching_keywords = [kw for kw in stance_keywords if kw.lower() in message_words]
-            if matching_keywords:
-                return min(len(matching_keywords) / len(stance_keywords), 1.0) * 0.5
+            matching_count = sum(1 for kw in stance_keywords if kw in message_words)
+            if matching_count:
+                return min(matching_count / len(stance_keywords), 1.0) * 0.5
 
         return 0.0
 
-    def _check_role_relevance(self, message: AiMessage, target_member: AiGroupMember) -> float:
+    def _check_role_relevance(self, content_lower: str, tokens: MemberTokens) -> float:
         """检查消息是否与目标AI的角色相关"""
-        # 这里可以根据AI的personality字段推断角色
-        personality_lower = target_member.personality.lower() if target_member.personality is not None and target_member.personality.strip() else ""
-        message_content = message.content.lower() if message.content is not None else ""
-
-        # 检查消息是否涉及需要特定角色回应的情况
-        if (message.content is not None and "问题" in message_content and "专家" in personality_lower):
-            return 0.6
-        elif (message.content is not None and "辩论" in message_content and "批判" in personality_lower):
-            return 0.6
-        elif (message.content is not None and "建议" in message_content and "指导" in personality_lower):
+        # 根据AI的personality字段推断角色，只扫描该角色适用的触发关键词
+        if any(keyword in content_lower for keyword in tokens.role_triggers):
             return 0.6
 
         return 0.0
 
-    def _check_stance_relevance(self, message: AiMessage, target_member: AiGroupMember) -> float:
+    def _check_stance_relevance(self, content_lower: str, tokens: MemberTokens) -> float:
         """检查消息是否与目标AI的立场相关"""
-        if target_member.initial_stance is None or not target_member.initial_stance.strip():
+        stance_keywords = tokens.stance_keywords
+        if not stance_keywords:
             return 0.0
 
-        # 检查消息是否涉及目标AI的立场话题
-        stance_keywords = target_member.initial_stance.lower().split()
-        message_lower = message.content.lower() if message.content is not None else ""
-
         # 计算立场相关性
-        stance_matches = sum(1 for kw in stance_keywords if kw in message_lower)
+        stance_matches = sum(1 for kw in stance_keywords if kw in content_lower)
         if stance_matches > 0:
             return min(stance_matches / len(stance_keywords), 1.0) * 0.7
 
         return 0.0
 
-    def _get_previous_message(self, current_message: AiMessage) -> Optional[AiMessage]:
-        """获取当前消息的前一条消息"""
-        # 检查 current_message.created_at 是否为 None
-        if current_message.created_at is None:
-            return None
-            
-        prev_message = self.db.query(AiMessage).filter(
-            AiMessage.group_id == current_message.group_id,
-            AiMessage.created_at < current_message.created_at
-        ).order_by(
-            AiMessage.created_at.desc()
-        ).first()
-
-        return prev_message
-
     def _determine_relevance_type(self, scores: Dict[str, float]) -> str:
         """确定相关性类型"""
         if scores['direct_mention'] > 0:
@@ -145,12 +198,19 @@ class SmartTriggerDetector:
     def __init__(self, db_session: Session):
         self.db = db_session
         self.relevance_detector = MessageRelevanceDetector(db_session)
+        # 同一请求内 should_trigger_ai 与 get_trigger_reasons 共用查询结果，避免重复访问数据库
+        self._member_cache: Dict[int, Optional[AiGroupMember]] = {}
+        self._messages_cache: Dict[Tuple[int, int], list] = {}
+
+    def _get_target_member(self, target_member_id: int) -> Optional[AiGroupMember]:
+        """获取目标AI成员（按实例缓存）"""
+        if target_member_id not in self._member_cache:
+            self._member_cache[target_member_id] = self.db.get(AiGroupMember, target_member_id)
+        return self._member_cache[target_member_id]
 
     def should_trigger_ai(self, group_id: int, target_member_id: int, trigger_message: str = None) -> bool:
         """判断是否应该触发指定AI"""
-        target_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == target_member_id
-        ).first()
+        target_member = self._get_target_member(target_member_id)
 
         if not target_member:
             return False
@@ -172,33 +232,51 @@ class SmartTriggerDetector:
                 member_id=-1,  # 临时值
                 content=trigger_message
             )
-            relevance_result = self.relevance_detector.detect_relevance(mock_message, target_member)
-            return relevance_result['is_relevant']
+            return self.relevance_detector.is_relevant(mock_message, target_member)
 
         # 检查最近的消息是否与目标AI相关
         recent_messages = self._get_unprocessed_messages(group_id, target_member_id)
 
-        for msg in recent_messages:
-            relevance_result = self.relevance_detector.detect_relevance(msg, target_member)
-            if relevance_result['is_relevant']:
+        for msg, _sender, previous_member_id in recent_messages:
+            if self.relevance_detector.is_relevant(msg, target_member, previous_member_id):
                 return True
 
         return False
 
-    def _get_unprocessed_messages(self, group_id: int, target_member_id: int):
-        """获取未处理的消息（实际应用中可能需要一个已处理消息的标记）"""
+    def _get_unprocessed_messages(self, group_id: int, target_member_id: int, limit: int = 5):
+        """
+        获取未处理的消息（实际应用中可能需要一个已处理消息的标记）
+
+        一次查询同时取出发送者信息，并多取一条消息用于确定每条消息的前一条发送者，
+        避免逐条查询发送者和前一条消息。
+
+        Returns:
+            [(消息, 发送者成员或None, 前一条消息的发送者ID或None), ...]，按时间倒序
+        """
+        cache_key = (group_id, limit)
+        if cache_key in self._messages_cache:
+            return self._messages_cache[cache_key]
+
         # 简化实现：获取最近5条消息
-        return self.db.query(AiMessage).filter(
+        rows = self.db.query(AiMessage, AiGroupMember).outerjoin(
+            AiGroupMember, AiMessage.member_id == AiGroupMember.id
+        ).filter(
             AiMessage.group_id == group_id
         ).order_by(
             AiMessage.created_at.desc()
-        ).limit(5).all()
+        ).limit(limit + 1).all()
+
+        messages = []
+        for index, (msg, sender) in enumerate(rows[:limit]):
+            previous_member_id = rows[index + 1][0].member_id if index + 1 < len(rows) else None
+            messages.append((msg, sender, previous_member_id))
+
+        self._messages_cache[cache_key] = messages
+        return messages
 
     def get_trigger_reasons(self, group_id: int, target_member_id: int) -> list:
         """获取触发AI的原因"""
-        target_member = self.db.query(AiGroupMember).filter(
-            AiGroupMember.id == target_member_id
-        ).first()
+        target_member = self._get_target_member(target_member_id)
 
         if not target_member:
             return []
@@ -206,13 +284,11 @@ class SmartTriggerDetector:
         recent_messages = self._get_unprocessed_messages(group_id, target_member_id)
         trigger_reasons = []
 
-        for msg in recent_messages:
-            relevance_result = self.relevance_detector.detect_relevance(msg, target_member)
+        for msg, sender, previous_member_id in recent_messages:
+            relevance_result = self.relevance_detector.detect_relevance(
+                msg, target_member, previous_member_id
+            )
             if relevance_result['is_relevant']:
-                sender = self.db.query(AiGroupMember).filter(
-                    AiGroupMember.id == msg.member_id
-                ).first()
-
                 reason = {
                     'message': msg.content,
                     'sender': sender.ai_nickname if (sender and sender.ai_nickname is not None) else 'Unknown',
@@ -1,29 +1,34 @@
+import base64
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, or_, desc, func, select, update, delete, insert
 from typing import Optional, Tuple, List
 from app.models.conversation import Conversation, ConversationMember, ChatMessage
 from app.models.historical_figure import HistoricalFigure
 from app.schemas.conversation import (
     ConversationCreate, ConversationUpdate,
     ConversationMemberCreate, ConversationMemberUpdate,
-    ChatMessageCreate, ChatMessageUpdate
+    ChatMessageCreate, ChatMessageUpdate,
+    ConversationMemberWithUserInfo, ConversationSummary
 )
 
 
 # 会话相关服务
 def get_conversation(db: Session, conversation_id: str):
     """根据ID获取会话"""
-    return db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    return db.get(Conversation, conversation_id)
 
 
-def get_conversations(db: Session, skip: int = 0, limit: int = 10, conversation_type: Optional[str] = None):
-    """获取会话列表（支持分页和类型筛选）"""
+def get_conversations(
+    db: Session, skip: int = 0, limit: int = 10, conversation_type: Optional[str] = None, include_total: bool = True
+):
+    """获取会话列表（支持分页和类型筛选），include_total 为 False 时跳过 COUNT 查询，total 返回 None"""
     query = db.query(Conversation)
     
     if conversation_type:
         query = query.filter(Conversation.conversation_type == conversation_type)
     
-    total = query.count()
+    total = query.count() if include_total else None
     conversations = query.order_by(desc(Conversation.updated_at)).offset(skip).limit(limit).all()
     return conversations, total
 
@@ -39,7 +44,7 @@ def create_conversation(db: Session, conversation: ConversationCreate):
 
 def update_conversation(db: Session, conversation_id: str, conversation_update: ConversationUpdate):
     """更新会话信息"""
-    db_conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    db_conversation = db.get(Conversation, conversation_id)
     if db_conversation:
         update_data = conversation_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -49,61 +54,106 @@ def update_conversation(db: Session, conversation_id: str, conversation_update:
     return db_conversation
 
 
-def delete_conversation(db: Session, conversation_id: str):
-    """删除会话"""
-    db_conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if db_conversation:
-        db.delete(db_conversation)
-        db.commit()
-    return db_conversation
+def delete_conversation(db: Session, conversation_id: str) -> bool:
+    """删除会话（单条 DELETE 语句），返回会话是否存在"""
+    result = db.execute(delete(Conversation).where(Conversation.id == conversation_id))
+    db.commit()
+    return result.rowcount > 0
 
 
 # 会话成员相关服务
 def get_conversation_member(db: Session, member_id: int):
     """根据ID获取会话成员"""
-    return db.query(ConversationMember).filter(ConversationMember.id == member_id).first()
-
-
-def get_conversation_members(db: Session, conversation_id: str, skip: int = 0, limit: int = 10):
-    """获取会话成员列表（支持分页）"""
-    # 使用JOIN查询获取成员的名称和头像信息
-    query = db.query(
-        ConversationMember,
+    return db.get(ConversationMember, member_id)
+
+
+def get_conversation_members(
+    db: Session, conversation_id: str, skip: int = 0, limit: int = 10, include_total: bool = True
+):
+    """获取会话成员列表（支持分页），include_total 为 False 时跳过 COUNT 查询，total 返回 None"""
+    # 使用JOIN查询获取成员的名称和头像信息，只查询需要的列，不构建ORM对象
+    query = select(
+        ConversationMember.id,
+        ConversationMember.conversation_id,
+        ConversationMember.user_id,
+        ConversationMember.user_role,
+        ConversationMember.joined_at,
         HistoricalFigure.name.label('member_name'),
         HistoricalFigure.avatar.label('avatar')
     ).outerjoin(
         HistoricalFigure, ConversationMember.user_id == HistoricalFigure.id
-    ).filter(ConversationMember.conversation_id == conversation_id)
+    ).where(ConversationMember.conversation_id == conversation_id)
 
-    total_query = db.query(ConversationMember).filter(ConversationMember.conversation_id == conversation_id)
-    total = total_query.count()
+    total = None
+    if include_total:
+        total = db.query(func.count(ConversationMember.id)).filter(
+            ConversationMember.conversation_id == conversation_id
+        ).scalar()
 
-    results = query.offset(skip).limit(limit).all()
+    rows = db.execute(query.offset(skip).limit(limit)).mappings().all()
     # 将结果转换为包含额外字段的对象
-    from app.schemas.conversation import ConversationMemberWithUserInfo
-    members = []
-    for member, member_name, avatar in results:
-        # 创建包含额外字段的响应对象
-        member_response = ConversationMemberWithUserInfo(
-            id=member.id,
-            conversation_id=member.conversation_id,
-            user_id=member.user_id,
-            user_role=member.user_role,
-            joined_at=member.joined_at,
-            member_name=member_name,
-            avatar=avatar
-        )
-        members.append(member_response)
+    # 字段直接来自数据库且类型已确定，使用 model_construct 跳过逐条校验
+    members = [ConversationMemberWithUserInfo.model_construct(**row) for row in rows]
 
     return members, total
 
 
-def get_user_conversations(db: Session, user_id: int, skip: int = 0, limit: int = 10):
-    """获取用户参与的所有会话"""
+# 会话列表中最后一条消息预览的最大长度
+LAST_MESSAGE_PREVIEW_LENGTH = 50
+
+
+def get_user_conversations(db: Session, user_id: int, skip: int = 0, limit: int = 10, include_total: bool = True):
+    """
+    获取用户参与的所有会话，附带每个会话的最后一条消息与成员数
+    include_total 为 False 时跳过 COUNT 查询，total 返回 None
+    """
     query = db.query(Conversation).join(ConversationMember).filter(ConversationMember.user_id == user_id)
-    total = query.count()
+    total = query.count() if include_total else None
     conversations = query.offset(skip).limit(limit).all()
-    return conversations, total
+    if not conversations:
+        return [], total
+
+    # 按当前页的会话ID分组聚合，固定两条查询，避免逐会话查询最后消息和成员数
+    conversation_ids = [conversation.id for conversation in conversations]
+    member_counts = dict(
+        db.query(ConversationMember.conversation_id, func.count(ConversationMember.id))
+        .filter(ConversationMember.conversation_id.in_(conversation_ids))
+        .group_by(ConversationMember.conversation_id)
+        .all()
+    )
+    # 消息ID自增，每个会话 MAX(id) 即最后一条消息，可走 (conversation_id, is_deleted, ...) 索引
+    latest_ids = (
+        db.query(func.max(ChatMessage.id).label('id'))
+        .filter(ChatMessage.conversation_id.in_(conversation_ids), ChatMessage.is_deleted == 0)
+        .group_by(ChatMessage.conversation_id)
+        .subquery()
+    )
+    last_messages = {
+        conversation_id: (message_id, created_at, content)
+        for conversation_id, message_id, created_at, content in db.query(
+            ChatMessage.conversation_id, ChatMessage.id, ChatMessage.created_at, ChatMessage.content
+        ).join(latest_ids, ChatMessage.id == latest_ids.c.id).all()
+    }
+
+    summaries = []
+    for conversation in conversations:
+        message_id, created_at, content = last_messages.get(conversation.id, (None, None, None))
+        # 字段直接来自数据库且类型已确定，使用 model_construct 跳过逐条校验
+        summaries.append(ConversationSummary.model_construct(
+            id=conversation.id,
+            conversation_type=conversation.conversation_type,
+            conversation_name=conversation.conversation_name,
+            avatar=conversation.avatar,
+            description=conversation.description,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            last_message_id=message_id,
+            last_message_at=created_at,
+            last_message_preview=content[:LAST_MESSAGE_PREVIEW_LENGTH] if content else content,
+            member_count=member_counts.get(conversation.id, 0)
+        ))
+
+    return summaries, total
 
 
 def add_conversation_member(db: Session, member: ConversationMemberCreate):
@@ -115,9 +165,26 @@ def add_conversation_member(db: Session, member: ConversationMemberCreate):
     return db_member
 
 
+def add_conversation_members(db: Session, members: List[ConversationMemberCreate]) -> int:
+    """
+    批量添加会话成员，返回添加数量
+
+    所有成员在一条批量 INSERT 中写入并只提交一次，适用于创建群聊时一次拉入多人；
+    任一成员违反 (conversation_id, user_id) 唯一约束时整批回滚。
+    """
+    if not members:
+        return 0
+
+    member_dicts = [member.model_dump() for member in members]
+
+    db.execute(insert(ConversationMember), member_dicts)
+    db.commit()
+    return len(member_dicts)
+
+
 def update_conversation_member(db: Session, member_id: int, member_update: ConversationMemberUpdate):
     """更新会话成员信息"""
-    db_member = db.query(ConversationMember).filter(ConversationMember.id == member_id).first()
+    db_member = db.get(ConversationMember, member_id)
     if db_member:
         update_data = member_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -127,189 +194,184 @@ def update_conversation_member(db: Session, member_id: int, member_update: Conve
     return db_member
 
 
-def remove_conversation_member(db: Session, member_id: int):
-    """移除会话成员"""
-    db_member = db.query(ConversationMember).filter(ConversationMember.id == member_id).first()
-    if db_member:
-        db.delete(db_member)
-        db.commit()
-    return db_member
+def remove_conversation_member(db: Session, member_id: int) -> bool:
+    """移除会话成员（单条 DELETE 语句），返回成员是否存在"""
+    result = db.execute(delete(ConversationMember).where(ConversationMember.id == member_id))
+    db.commit()
+    return result.rowcount > 0
 
 
-def remove_user_from_conversation(db: Session, conversation_id: str, user_id: int):
-    """将用户从会话中移除"""
-    db_member = db.query(ConversationMember).filter(
-        and_(ConversationMember.conversation_id == conversation_id, 
+def remove_user_from_conversation(db: Session, conversation_id: str, user_id: int) -> bool:
+    """将用户从会话中移除（单条 DELETE 语句），返回用户是否在该会话中"""
+    result = db.execute(delete(ConversationMember).where(
+        and_(ConversationMember.conversation_id == conversation_id,
              ConversationMember.user_id == user_id)
-    ).first()
-    if db_member:
-        db.delete(db_member)
-        db.commit()
-    return db_member
+    ))
+    db.commit()
+    return result.rowcount > 0
 
 
 # 消息相关服务
+def encode_message_cursor(message: ChatMessage) -> str:
+    """将消息的 (created_at, id) 编码为分页游标"""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析分页游标，格式不正确时抛出 ValueError"""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+# 消息列表查询的列：消息字段及发送者的名称和头像，与 ChatMessageResponse 字段一一对应
+_MESSAGE_LIST_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.conversation_id,
+    ChatMessage.user_id,
+    ChatMessage.content,
+    ChatMessage.message_type,
+    ChatMessage.content_format,
+    ChatMessage.is_deleted,
+    ChatMessage.message_metadata,
+    ChatMessage.created_at,
+    ChatMessage.updated_at,
+    ChatMessage.display_time,
+    HistoricalFigure.name.label('member_name'),
+    HistoricalFigure.avatar.label('avatar'),
+)
+
+
 def get_chat_message(db: Session, message_id: int):
     """根据ID获取聊天消息"""
-    return db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+    return db.get(ChatMessage, message_id)
+
+
+def get_chat_messages(
+    db: Session,
+    conversation_id: str,
+    skip: int = 0,
+    limit: int = 10,
+    include_total: bool = True,
+    cursor: Optional[Tuple[datetime, int]] = None
+):
+    """
+    获取会话中的消息列表（支持分页），include_total 为 False 时跳过 COUNT 查询，total 返回 None
+
+    传入 cursor（上一页最后一条消息的 (created_at, id)）时使用游标分页，忽略 skip，
+    直接从上一页结束处继续读取，翻页深度不再影响查询耗时。
+    消息以只读的行映射返回（含 member_name、avatar），不构建ORM对象。
+    """
+    # 列表查询与计数共用同一筛选条件
+    message_filter = and_(ChatMessage.conversation_id == conversation_id,
+                          ChatMessage.is_deleted == 0)  # 只返回未删除的消息
 
-
-def get_chat_messages(db: Session, conversation_id: str, skip: int = 0, limit: int = 10):
-    """获取会话中的消息列表（支持分页）"""
     # 使用 JOIN 查询获取消息及对应的用户信息
-    query = db.query(
-        ChatMessage,
-        HistoricalFigure.name.label('member_name'),
-        HistoricalFigure.avatar.label('avatar')
-    ).outerjoin(
+    query = select(*_MESSAGE_LIST_COLUMNS).outerjoin(
         HistoricalFigure, ChatMessage.user_id == HistoricalFigure.id
-    ).filter(
-        and_(ChatMessage.conversation_id == conversation_id,
-             ChatMessage.is_deleted == 0)  # 只返回未删除的消息
-    )
-    total = db.query(ChatMessage).filter(
-        and_(ChatMessage.conversation_id == conversation_id,
-             ChatMessage.is_deleted == 0)
-    ).count()
-    results = query.order_by(ChatMessage.created_at).offset(skip).limit(limit).all()
-
-    # 处理消息对象，添加用户信息
-    messages = []
-    for message, member_name, avatar in results:
-        # 设置额外的属性
-        message.member_name = member_name
-        message.avatar = avatar
-
-        # 处理 display_time 字段，确保它是字符串类型
-        if hasattr(message, 'display_time') and message.display_time is not None:
-            # 如果 display_time 是 timedelta 对象，则转换为 HH:MM:SS 格式的字符串
-            if hasattr(message.display_time, 'total_seconds'):
-                total_seconds = int(message.display_time.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                message.display_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
-        messages.append(message)
+    ).where(message_filter)
+    total = None
+    if include_total:
+        total = db.query(func.count(ChatMessage.id)).filter(message_filter).scalar()
+    if cursor is not None:
+        cursor_created_at, cursor_id = cursor
+        query = query.where(or_(
+            ChatMessage.created_at > cursor_created_at,
+            and_(ChatMessage.created_at == cursor_created_at, ChatMessage.id > cursor_id)
+        ))
+    query = query.order_by(ChatMessage.created_at, ChatMessage.id)
+    if cursor is None:
+        query = query.offset(skip)
+    messages = db.execute(query.limit(limit)).mappings().all()
 
     return messages, total
 
 
 def create_chat_message(db: Session, message: ChatMessageCreate):
     """创建新消息"""
-    # 将message_metadata映射到数据库列名metadata
-    message_dict = message.model_dump()
-
-    # 处理 display_time 字段，确保它是正确的格式
-    if 'display_time' in message_dict and message_dict['display_time']:
-        # 如果 display_time 不是 HH:MM:SS 格式，尝试标准化
-        display_time = message_dict['display_time']
-        # 如果是自定义格式如"昨天 16:14"，只保留时间部分
-        if isinstance(display_time, str) and ':' in display_time:
-            # 提取时间部分 (HH:MM 或 HH:MM:SS)
-            time_part = display_time.split()[-1]  # 取最后一个部分，通常是时间
-            if len(time_part.split(':')) == 2:  # 如果是 HH:MM 格式
-                time_part += ':00'  # 添加秒部分
-            message_dict['display_time'] = time_part
-        elif not isinstance(display_time, str):
-            # 如果不是字符串类型，设置为 None
-            message_dict['display_time'] = None
-
+    # display_time 已在请求模型校验时规范为 HH:MM:SS
     # 由于模型中使用了Column('metadata', ...)，SQLAlchemy会自动映射
-    db_message = ChatMessage(**message_dict)
+    db_message = ChatMessage(**message.model_dump())
     db.add(db_message)
     db.commit()
     db.refresh(db_message)
 
-    # 确保 display_time 是字符串格式，避免 Pydantic 验证错误
-    if hasattr(db_message, 'display_time') and db_message.display_time is not None:
-        if hasattr(db_message.display_time, 'total_seconds'):
-            total_seconds = int(db_message.display_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            db_message.display_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
     return db_message
 
 
+def create_chat_messages(db: Session, messages: List[ChatMessageCreate]) -> int:
+    """
+    批量创建消息，返回创建数量
+
+    所有消息在一条批量 INSERT 中写入并只提交一次，适用于导入整段对话；
+    不回读数据库生成的ID和时间，需要完整消息对象时请使用 create_chat_message。
+    """
+    if not messages:
+        return 0
+
+    message_dicts = [message.model_dump() for message in messages]
+
+    db.execute(insert(ChatMessage), message_dicts)
+    db.commit()
+    return len(message_dicts)
+
+
 def update_chat_message(db: Session, message_id: int, message_update: ChatMessageUpdate):
     """更新消息信息"""
-    db_message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+    db_message = db.get(ChatMessage, message_id)
     if db_message:
         update_data = message_update.model_dump(exclude_unset=True)
-
-        # 处理 display_time 字段，确保它是正确的格式
-        if 'display_time' in update_data and update_data['display_time']:
-            display_time = update_data['display_time']
-            # 如果是自定义格式如"昨天 16:14"，只保留时间部分
-            if isinstance(display_time, str) and ':' in display_time:
-                # 提取时间部分 (HH:MM 或 HH:MM:SS)
-                time_part = display_time.split()[-1]  # 取最后一个部分，通常是时间
-                if len(time_part.split(':')) == 2:  # 如果是 HH:MM 格式
-                    time_part += ':00'  # 添加秒部分
-                update_data['display_time'] = time_part
-            elif not isinstance(display_time, str):
-                # 如果不是字符串类型，设置为 None
-                update_data['display_time'] = None
-
         for field, value in update_data.items():
             setattr(db_message, field, value)
         db.commit()
         db.refresh(db_message)
 
-        # 确保 display_time 是字符串格式，避免 Pydantic 验证错误
-        if hasattr(db_message, 'display_time') and db_message.display_time is not None:
-            if hasattr(db_message.display_time, 'total_seconds'):
-                total_seconds = int(db_message.display_time.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                db_message.display_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
     return db_message
 
 
-def delete_chat_message(db: Session, message_id: int):
-    """删除消息（软删除）"""
-    db_message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-    if db_message:
-        db_message.is_deleted = 1
-        db.commit()
-        db.refresh(db_message)
-    return db_message
-
-
-def get_user_messages(db: Session, user_id: int, skip: int = 0, limit: int = 10):
-    """获取用户发送的所有消息"""
+def delete_chat_message(db: Session, message_id: int) -> bool:
+    """删除消息（软删除，单条 UPDATE 语句），返回消息是否存在"""
+    result = db.execute(
+        update(ChatMessage).where(ChatMessage.id == message_id).values(is_deleted=1)
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def get_user_messages(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 10,
+    include_total: bool = True,
+    cursor: Optional[Tuple[datetime, int]] = None
+):
+    """
+    获取用户发送的所有消息，include_total 为 False 时跳过 COUNT 查询，total 返回 None
+
+    传入 cursor（上一页最后一条消息的 (created_at, id)）时使用游标分页，忽略 skip。
+    消息以只读的行映射返回（含 member_name、avatar），不构建ORM对象。
+    """
     # 使用 JOIN 查询获取消息及对应的用户信息
-    query = db.query(
-        ChatMessage,
-        HistoricalFigure.name.label('member_name'),
-        HistoricalFigure.avatar.label('avatar')
-    ).outerjoin(
+    query = select(*_MESSAGE_LIST_COLUMNS).outerjoin(
         HistoricalFigure, ChatMessage.user_id == HistoricalFigure.id
-    ).filter(ChatMessage.user_id == user_id)
-    total = query.count()
-    results = query.order_by(desc(ChatMessage.created_at)).offset(skip).limit(limit).all()
-
-    # 处理消息对象，添加用户信息
-    messages = []
-    for message, member_name, avatar in results:
-        # 设置额外的属性
-        message.member_name = member_name
-        message.avatar = avatar
-
-        # 处理 display_time 字段，确保它是字符串类型
-        if hasattr(message, 'display_time') and message.display_time is not None:
-            # 如果 display_time 是 timedelta 对象，则转换为 HH:MM:SS 格式的字符串
-            if hasattr(message.display_time, 'total_seconds'):
-                total_seconds = int(message.display_time.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                message.display_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
-        messages.append(message)
+    ).where(ChatMessage.user_id == user_id)
+    total = None
+    if include_total:
+        # 计数只需要消息表，不必带上人物表的联表
+        total = db.query(func.count(ChatMessage.id)).filter(ChatMessage.user_id == user_id).scalar()
+    if cursor is not None:
+        cursor_created_at, cursor_id = cursor
+        query = query.where(or_(
+            ChatMessage.created_at < cursor_created_at,
+            and_(ChatMessage.created_at == cursor_created_at, ChatMessage.id < cursor_id)
+        ))
+    query = query.order_by(desc(ChatMessage.created_at), desc(ChatMessage.id))
+    if cursor is None:
+        query = query.offset(skip)
+    messages = db.execute(query.limit(limit)).mappings().all()
 
     return messages, total
\ No newline at end of file
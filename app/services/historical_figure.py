@@ -1,17 +1,18 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from app.models.historical_figure import HistoricalFigure
 from app.schemas.historical_figure import HistoricalFigureCreate, HistoricalFigureUpdate
 
 
 def get_historical_figure(db: Session, figure_id: int):
     """根据ID获取历史人物"""
-    return db.query(HistoricalFigure).filter(HistoricalFigure.id == figure_id).first()
+    return db.get(HistoricalFigure, figure_id)
 
 
-def get_historical_figures(db: Session, skip: int = 0, limit: int = 10):
-    """获取历史人物列表（支持分页）"""
+def get_historical_figures(db: Session, skip: int = 0, limit: int = 10, include_total: bool = True):
+    """获取历史人物列表（支持分页），include_total 为 False 时跳过 COUNT 查询，total 返回 None"""
     query = db.query(HistoricalFigure)
-    total = query.count()
+    total = db.query(func.count(HistoricalFigure.id)).scalar() if include_total else None
     figures = query.offset(skip).limit(limit).all()
     return figures, total
 
@@ -27,7 +28,7 @@ def create_historical_figure(db: Session, figure: HistoricalFigureCreate):
 
 def update_historical_figure(db: Session, figure_id: int, figure_update: HistoricalFigureUpdate):
     """更新历史人物信息"""
-    db_figure = db.query(HistoricalFigure).filter(HistoricalFigure.id == figure_id).first()
+    db_figure = db.get(HistoricalFigure, figure_id)
     if db_figure:
         update_data = figure_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -39,7 +40,7 @@ def update_historical_figure(db: Session, figure_id: int, figure_update: Histori
 
 def delete_historical_figure(db: Session, figure_id: int):
     """删除历史人物"""
-    db_figure = db.query(HistoricalFigure).filter(HistoricalFigure.id == figure_id).first()
+    db_figure = db.get(HistoricalFigure, figure_id)
     if db_figure:
         db.delete(db_figure)
         db.commit()
@@ -4,10 +4,38 @@
 """
 
 import re
-from typing import List, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
 from sqlalchemy.orm import Session
 from app.models.ai_chat import AiGroupMember
 
+# 匹配 @昵称 格式（支持中文、英文、数字、下划线），模块加载时编译一次
+MENTION_PATTERN = re.compile(r'@([\u4e00-\u9fa5a-zA-Z0-9_]+)')
+
+
+class MentionedMember(NamedTuple):
+    """被@的AI成员（名册缓存中的只读快照，包含触发回复所需的字段）"""
+    id: int
+    ai_nickname: str
+    ai_model: Optional[str]
+    personality: Optional[str]
+
+
+# 群组AI成员名册缓存：group_id -> (过期时间, {casefold 后的昵称: 成员快照})
+# 群成员很少变动，命中缓存时解析@提及无需查询数据库；成员增删改时主动失效
+_ROSTER_CACHE: "OrderedDict[int, tuple[float, Dict[str, MentionedMember]]]" = OrderedDict()
+_ROSTER_CACHE_MAX_SIZE = 1024
+_ROSTER_CACHE_TTL_SECONDS = 60
+_ROSTER_CACHE_LOCK = threading.Lock()
+
+
+def invalidate_group_roster(group_id: int) -> None:
+    """群成员变动后清除该群的名册缓存"""
+    with _ROSTER_CACHE_LOCK:
+        _ROSTER_CACHE.pop(group_id, None)
+
 
 class MentionParser:
     """解析消息中的@提及"""
@@ -28,14 +56,9 @@ class MentionParser:
         if not content:
             return []
 
-        # 匹配 @昵称 格式（支持中文、英文、数字、下划线）
-        # @后面跟着一个或多个非空白字符
-        pattern = r'@([\u4e00-\u9fa5a-zA-Z0-9_]+)'
-        matches = re.findall(pattern, content)
-
-        return matches
+        return MENTION_PATTERN.findall(content)
 
-    def find_mentioned_members(self, group_id: int, nicknames: List[str]) -> List[AiGroupMember]:
+    def find_mentioned_members(self, group_id: int, nicknames: List[str]) -> List[MentionedMember]:
         """
         根据昵称列表查找群组中的AI成员
 
@@ -49,28 +72,48 @@ class MentionParser:
         if not nicknames:
             return []
 
-        # 获取群组中所有AI成员
-        all_members = self.db.query(AiGroupMember).filter(
+        # 按传入顺序在名册中解析成员（不区分大小写）；dict.fromkeys 保序去重，避免逐个 in 列表查找
+        nickname_map = self._get_group_roster(group_id)
+        resolved = (nickname_map.get(nickname.casefold()) for nickname in dict.fromkeys(nicknames))
+        members_by_id = {member.id: member for member in resolved if member is not None}
+        return list(members_by_id.values())
+
+    def _get_group_roster(self, group_id: int) -> Dict[str, MentionedMember]:
+        """获取群组AI成员的 {casefold 后的昵称: 成员快照} 映射，有效期内直接使用缓存"""
+        now = time.monotonic()
+        with _ROSTER_CACHE_LOCK:
+            entry = _ROSTER_CACHE.get(group_id)
+            if entry is not None and entry[0] >= now:
+                _ROSTER_CACHE.move_to_end(group_id)
+                return entry[1]
+
+        # 获取群组中所有AI成员（只取解析和触发回复需要的列）
+        rows = self.db.query(
+            AiGroupMember.id,
+            AiGroupMember.ai_nickname,
+            AiGroupMember.ai_model,
+            AiGroupMember.personality
+        ).filter(
             AiGroupMember.group_id == group_id,
             AiGroupMember.member_type == 1  # 只取AI成员
         ).all()
 
-        # 创建昵称到成员的映射（不区分大小写）
-        nickname_map = {}
-        for member in all_members:
-            if member.ai_nickname:
-                nickname_map[member.ai_nickname.lower()] = member
+        # 创建昵称到成员快照的映射（casefold 比 lower 更完整地处理 Unicode 大小写）
+        nickname_map = {
+            row.ai_nickname.casefold(): MentionedMember(*row)
+            for row in rows
+            if row.ai_nickname
+        }
 
-        # 按传入顺序查找匹配的成员
-        mentioned_members = []
-        for nickname in nicknames:
-            member = nickname_map.get(nickname.lower())
-            if member and member not in mentioned_members:  # 避免重复
-                mentioned_members.append(member)
+        with _ROSTER_CACHE_LOCK:
+            _ROSTER_CACHE[group_id] = (now + _ROSTER_CACHE_TTL_SECONDS, nickname_map)
+            _ROSTER_CACHE.move_to_end(group_id)
+            if len(_ROSTER_CACHE) > _ROSTER_CACHE_MAX_SIZE:
+                _ROSTER_CACHE.popitem(last=False)
 
-        return mentioned_members
+        return nickname_map
 
-    def parse_mentions_in_group(self, content: str, group_id: int) -> List[AiGroupMember]:
+    def parse_mentions_in_group(self, content: str, group_id: int) -> List[MentionedMember]:
         """
         解析消息在指定群组中的@提及
 
@@ -86,4 +129,5 @@ class MentionParser:
 
     def has_mentions(self, content: str) -> bool:
         """检查消息是否包含@提及"""
-        return len(self.extract_mentions(content)) > 0
+        # 找到第一个@提及即可返回，无需提取全部
+        return bool(content) and MENTION_PATTERN.search(content) is not None
@@ -107,7 +107,7 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
 def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
     """Get a user by ID."""
     logger.debug(f"Querying user by ID: {user_id}")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if user:
         logger.debug(f"User found for ID: {user_id}")
     else:
@@ -160,7 +160,7 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
 def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[User]:
     """Update a user's information."""
     logger.info(f"Updating user with ID: {user_id}")
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = db.get(User, user_id)
     if not db_user:
         logger.warning(f"User with ID {user_id} not found for update")
         return None